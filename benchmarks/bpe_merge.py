@@ -0,0 +1,94 @@
+"""
+Module: benchmarks.bpe_merge
+
+Compare the "scan" and "heap" merge engines of the GPT-2 Encoder on long,
+pathological pre-tokens such as URLs, base64 blobs and code identifiers.
+The "ids" column merges the raw UTF-8 bytes straight into token ids.
+
+Usage:
+    python -m benchmarks.bpe_merge -m 124M -d models
+"""
+
+import argparse
+import base64
+import random
+import time
+
+from mod.gpt.encoder import Encoder
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark BPE merge engines")
+    parser.add_argument(
+        "-m", "--model-name", default="124M", help="The GPT-2 model name"
+    )
+    parser.add_argument(
+        "-d", "--models-dir", default="models", help="The GPT-2 models directory"
+    )
+    parser.add_argument(
+        "-n",
+        "--length",
+        type=int,
+        default=4096,
+        help="Length of each pathological pre-token in bytes (default: 4096)",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Number of timed runs"
+    )
+    return parser.parse_args()
+
+
+def get_tokens(length: int, seed: int = 1337) -> dict[str, str]:
+    rng = random.Random(seed)
+    blob = base64.b64encode(rng.randbytes(length)).decode("ascii")[:length]
+    url = "https://example.com/" + "/".join(
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8))
+        for _ in range(length // 9)
+    )
+    identifier = "".join(
+        rng.choice(["get", "Set", "_value", "Index", "Of", "_", "2"])
+        for _ in range(length // 3)
+    )
+    return {
+        "base64": blob,
+        "url": url[:length],
+        "identifier": identifier[:length],
+        "repeated": "a" * length,
+    }
+
+
+def time_engine(encoder: Encoder, engine, token: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        encoder.cache.clear()
+        start = time.perf_counter()
+        engine(token)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = get_arguments()
+    encoder = Encoder.get_encoder(args.model_name, args.models_dir)
+
+    print(
+        f"{'token':>12} | {'scan (s)':>10} | {'heap (s)':>10} | {'ids (s)':>10}"
+        f" | {'speedup':>8}"
+    )
+    for name, text in get_tokens(args.length).items():
+        token = "".join(encoder.byte_encoder[b] for b in text.encode("utf-8"))
+        encoder.cache.clear()
+        expected = encoder.bpe(token)
+        encoder.cache.clear()
+        assert encoder.bpe_heap(token) == expected, f"engines disagree on {name}"
+        scan = time_engine(encoder, encoder.bpe, token, args.repeat)
+        heap = time_engine(encoder, encoder.bpe_heap, token, args.repeat)
+        ids = time_engine(encoder, encoder.bpe_ids, text.encode("utf-8"), args.repeat)
+        print(
+            f"{name:>12} | {scan:10.4f} | {heap:10.4f} | {ids:10.4f}"
+            f" | {scan / ids:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Module: benchmarks.gpt_vocab
+
+Compare the cold start of the GPT-2 Encoder loaded from 'encoder.json' and
+'vocab.bpe' against the compiled 'vocab.bin', for both merge engines.
+
+Without --models-dir, a synthetic byte-level vocab of the given size is written to a
+temporary directory first.
+
+Usage:
+    python -m benchmarks.gpt_vocab -n 50000
+    python -m benchmarks.gpt_vocab -d models -m 124M
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable
+
+from mod.gpt.encoder import Encoder
+from mod.gpt.vocab import compile_vocab
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark GPT-2 vocab loading")
+    parser.add_argument("-m", "--model-name", default="124M", help="The model name")
+    parser.add_argument("-d", "--models-dir", help="Load a GPT-2 models directory")
+    parser.add_argument(
+        "-n",
+        "--n-merges",
+        type=int,
+        default=50000,
+        help="Number of merges of the synthetic vocab (default: 50000)",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Number of timed runs"
+    )
+    return parser.parse_args()
+
+
+def write_synthetic_vocab(model_path: str, n_merges: int, seed: int = 1337) -> None:
+    rng = random.Random(seed)
+    tokens = list(Encoder.bytes_to_unicode().values())
+    short = list(tokens)
+    vocab = set(tokens)
+    merges = []
+    while len(merges) < n_merges:
+        first, second = rng.choice(short), rng.choice(short)
+        merged = first + second
+        if merged in vocab:
+            continue
+        merges.append((first, second))
+        tokens.append(merged)
+        vocab.add(merged)
+        if len(merged) <= 8:
+            short.append(merged)
+
+    os.makedirs(model_path, exist_ok=True)
+    encoder = {token: idx for idx, token in enumerate(tokens)}
+    with open(os.path.join(model_path, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump(encoder, f)
+    with open(os.path.join(model_path, "vocab.bpe"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+        f.writelines(f"{first} {second}\n" for first, second in merges)
+
+
+def best_of(load: Callable[[], Encoder], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        load()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = get_arguments()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        models_dir = args.models_dir or tmp_dir
+        if not args.models_dir:
+            write_synthetic_vocab(os.path.join(tmp_dir, args.model_name), args.n_merges)
+        model_path = os.path.join(models_dir, args.model_name)
+        with open(os.path.join(model_path, "encoder.json"), encoding="utf-8") as f:
+            encoder = json.load(f)
+        with open(os.path.join(model_path, "vocab.bpe"), encoding="utf-8") as f:
+            bpe_merges = [tuple(line.split()) for line in f.read().split("\n")[1:-1]]
+        compiled_path = os.path.join(tmp_dir, "vocab.bin")
+        compile_vocab(compiled_path, encoder, bpe_merges)
+        print(f"{len(encoder)} tokens, {len(bpe_merges)} merges")
+
+        def load_sources(engine: str) -> Encoder:
+            # get_encoder without a vocab.bin next to the sources
+            with open(os.path.join(model_path, "encoder.json"), encoding="utf-8") as f:
+                encoder = json.load(f)
+            with open(os.path.join(model_path, "vocab.bpe"), encoding="utf-8") as f:
+                data = f.read()
+            merges = [tuple(line.split()) for line in data.split("\n")[1:-1]]
+            return Encoder(encoder, merges, engine)
+
+        print(
+            f"{'engine':>6} | {'sources ms':>10} | {'compiled ms':>11} | {'speedup':>7}"
+        )
+        for engine in ("heap", "scan"):
+            sources = best_of(lambda: load_sources(engine), args.repeat)
+            compiled = best_of(
+                lambda: Encoder.from_compiled(compiled_path, engine), args.repeat
+            )
+            print(
+                f"{engine:>6} | {sources * 1e3:10.1f} | {compiled * 1e3:11.1f}"
+                f" | {sources / compiled:6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Module: benchmarks.llama_bpe
+
+Compare the throughput of the pure Python llama Tokenizer backend against tiktoken,
+cold (empty merge cache) and warm (the same corpus encoded again).
+
+Usage:
+    python -m benchmarks.llama_bpe -m tokenizers/bpe/tokenizer.model -n 1
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+from mod.llama.tokenizer import Tokenizer
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark llama BPE backends")
+    parser.add_argument(
+        "-m",
+        "--model",
+        default="tokenizers/bpe/tokenizer.model",
+        help="Path to the tiktoken model file",
+    )
+    parser.add_argument(
+        "-n",
+        "--megabytes",
+        type=float,
+        default=1,
+        help="Size of each generated corpus in MB (default: 1)",
+    )
+    parser.add_argument("-f", "--file", help="Also benchmark a local text file")
+    return parser.parse_args()
+
+
+def get_corpora(size: int, seed: int = 1337) -> dict[str, str]:
+    rng = random.Random(seed)
+    words = "the of and to in is was for on as it's they'll 1984 2,500 $3.50".split()
+    words += ["tokenization", "unbelievably", "configuration", "Hello", "world"]
+    ascii = " ".join(rng.choice(words) for _ in range(size // 5))[:size]
+    mixed_words = words + ["Ünïcödé", "日本語", "Ελληνικά", "😸", "٣٤٥", "—", "«»"]
+    mixed = " ".join(rng.choice(mixed_words) for _ in range(size // 6))[:size]
+    return {"ascii": ascii, "mixed": mixed}
+
+
+def time_encode(tokenizer: Tokenizer, text: str) -> float:
+    start = time.perf_counter()
+    tokenizer.encode(text, bos=False, eos=False)
+    return time.perf_counter() - start
+
+
+def main():
+    args = get_arguments()
+    corpora = get_corpora(int(args.megabytes * 1024 * 1024))
+    if args.file:
+        corpora[Path(args.file).name] = Path(args.file).read_text(encoding="utf-8")
+
+    start = time.perf_counter()
+    tiktoken = Tokenizer(args.model, backend="tiktoken")
+    print(f"Loaded tiktoken backend in {time.perf_counter() - start:.3f}s")
+    start = time.perf_counter()
+    python = Tokenizer(args.model, backend="python")
+    print(f"Loaded python backend in {time.perf_counter() - start:.3f}s")
+
+    print(
+        f"{'corpus':>12} | {'tiktoken MB/s':>13} | {'cold MB/s':>9}"
+        f" | {'warm MB/s':>9} | {'slowdown':>8}"
+    )
+    for name, text in corpora.items():
+        python.model.cache.clear()
+        size = len(text.encode("utf-8")) / 1e6
+        reference = time_encode(tiktoken, text)
+        cold = time_encode(python, text)
+        warm = time_encode(python, text)
+        assert python.encode(text, bos=False, eos=False) == tiktoken.encode(
+            text, bos=False, eos=False
+        ), name
+        print(
+            f"{name:>12} | {size / reference:13.1f} | {size / cold:9.1f}"
+            f" | {size / warm:9.1f} | {warm / reference:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
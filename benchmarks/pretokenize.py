@@ -0,0 +1,79 @@
+"""
+Module: benchmarks.pretokenize
+
+Compare the throughput of the table driven PreTokenizer with the reference GPT-2
+pattern compiled by the regex module.
+
+Usage:
+    python -m benchmarks.pretokenize -n 4
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+
+import regex
+
+from mod.gpt.pretokenize import GPT2_PATTERN, PreTokenizer
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark GPT-2 pre-tokenizers")
+    parser.add_argument(
+        "-n",
+        "--megabytes",
+        type=float,
+        default=4,
+        help="Size of each generated corpus in MB (default: 4)",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, help="Number of timed runs"
+    )
+    parser.add_argument("-f", "--file", help="Also benchmark a local text file")
+    return parser.parse_args()
+
+
+def get_corpora(size: int, seed: int = 1337) -> dict[str, str]:
+    rng = random.Random(seed)
+    words = "the of and to in is was for on as it's they'll 1984 2,500 $3.50".split()
+    ascii = " ".join(rng.choice(words) for _ in range(size // 4))[:size]
+    mixed_words = words + ["Ünïcödé", "日本語", "Ελληνικά", "😸", "٣٤٥", "—", "«»"]
+    mixed = " ".join(rng.choice(mixed_words) for _ in range(size // 5))[:size]
+    return {"ascii": ascii, "mixed": mixed}
+
+
+def time_split(split, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        split(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = get_arguments()
+    corpora = get_corpora(int(args.megabytes * 1024 * 1024))
+    if args.file:
+        corpora[Path(args.file).name] = Path(args.file).read_text(encoding="utf-8")
+
+    start = time.perf_counter()
+    pretokenizer = PreTokenizer.default()
+    print(f"Built codepoint classes in {time.perf_counter() - start:.3f}s")
+    pattern = regex.compile(GPT2_PATTERN)
+
+    print(f"{'corpus':>12} | {'regex MB/s':>10} | {'table MB/s':>10} | {'speedup':>8}")
+    for name, text in corpora.items():
+        assert pretokenizer.findall(text) == pattern.findall(text), name
+        size = len(text.encode("utf-8")) / 1e6
+        reference = time_split(pattern.findall, text, args.repeat)
+        table = time_split(pretokenizer.findall, text, args.repeat)
+        print(
+            f"{name:>12} | {size / reference:10.1f} | {size / table:10.1f}"
+            f" | {reference / table:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
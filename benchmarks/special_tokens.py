@@ -0,0 +1,110 @@
+"""
+Module: benchmarks.special_tokens
+
+Compare encoding with every special token allowed through the trie based
+SpecialTokenSplitter of the llama Tokenizer against tiktoken's own special token
+handling, on text without special tokens and on chat template heavy text.
+
+Usage:
+    python -m benchmarks.special_tokens -m tokenizers/bpe/tokenizer.model
+"""
+
+import argparse
+import random
+import re
+import time
+
+from mod.llama.tokenizer import ChatFormat, Tokenizer
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark special token splitting")
+    parser.add_argument(
+        "-m",
+        "--model",
+        default="tokenizers/bpe/tokenizer.model",
+        help="Path to the tiktoken model file",
+    )
+    parser.add_argument(
+        "-n", "--documents", type=int, default=2000, help="Number of documents"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, help="Number of timed runs"
+    )
+    return parser.parse_args()
+
+
+def get_corpora(
+    formatter: ChatFormat, n_documents: int, seed: int = 1337
+) -> dict[str, list[str]]:
+    rng = random.Random(seed)
+    words = "the of and to in is was for on as it's they'll 1984 <b> a<c".split()
+
+    def sentence(n_words: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n_words))
+
+    plain = [sentence(100) for _ in range(n_documents)]
+    chat = []
+    for _ in range(n_documents):
+        dialog = [
+            {
+                "role": rng.choice(["system", "user", "assistant"]),
+                "content": sentence(8),
+            }
+            for _ in range(6)
+        ]
+        chat.append(formatter.tokenizer.decode(formatter.encode_dialog_prompt(dialog)))
+    return {"plain": plain, "chat": chat}
+
+
+def time_encode(encode, documents: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for document in documents:
+            encode(document)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = get_arguments()
+    tokenizer = Tokenizer(args.model)
+    corpora = get_corpora(ChatFormat(tokenizer), args.documents)
+    # Every special token as an alternative, like tiktoken's special token pattern
+    pattern = re.compile(f"({'|'.join(map(re.escape, tokenizer.special_tokens))})")
+
+    def split_regex(s: str) -> list[str]:
+        return pattern.split(s)
+
+    def split_trie(s: str) -> list[str]:
+        return tokenizer.special_splitter.split(s)
+
+    def encode_tiktoken(s: str) -> list[int]:
+        return tokenizer.model.encode(s, allowed_special="all")
+
+    def encode_trie(s: str) -> list[int]:
+        return tokenizer.encode(s, bos=False, eos=False, allowed_special="all")
+
+    print(
+        f"{'corpus':>8} | {'step':>6} | {'baseline MB/s':>13}"
+        f" | {'trie MB/s':>9} | {'speedup':>8}"
+    )
+    for name, documents in corpora.items():
+        size = sum(len(document.encode("utf-8")) for document in documents) / 1e6
+        for document in documents[:100]:
+            assert encode_trie(document) == encode_tiktoken(document), name
+        for step, baseline, trie in [
+            ("split", split_regex, split_trie),
+            ("encode", encode_tiktoken, encode_trie),
+        ]:
+            reference = time_encode(baseline, documents, args.repeat)
+            candidate = time_encode(trie, documents, args.repeat)
+            print(
+                f"{name:>8} | {step:>6} | {size / reference:13.1f}"
+                f" | {size / candidate:9.1f} | {reference / candidate:7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Module: benchmarks.suite
+
+Measure the throughput, per-document latency and peak memory of every tokenizer in
+the repo over synthetic and local corpora, and optionally write the results as JSON
+to track regressions over time.
+
+Targets:
+    gpt2      mod.gpt.encoder.Encoder (needs --models-dir with the GPT-2 files)
+    llama     mod.llama.tokenizer.Tokenizer
+    chat      mod.llama.tokenizer.ChatFormat dialog prompts
+    hf        a HF tokenizers model, e.g. one trained by mod.cli.train
+
+Peak memory is traced with tracemalloc in a separate pass, so it covers Python
+allocations only, not the internal buffers of tiktoken or HF tokenizers.
+
+Usage:
+    python -m benchmarks.suite -d models -f tokenizers/hf/tokenizer.json -o bench.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from mod.llama.tokenizer import ChatFormat, Tokenizer
+
+TARGETS = ("gpt2", "llama", "chat", "hf")
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the tokenizers")
+    parser.add_argument(
+        "-t",
+        "--targets",
+        nargs="+",
+        choices=TARGETS,
+        default=list(TARGETS),
+        help="Tokenizers to benchmark (default: all available)",
+    )
+    parser.add_argument(
+        "-m", "--model-name", default="124M", help="The GPT-2 model name"
+    )
+    parser.add_argument(
+        "-d", "--models-dir", default="models", help="The GPT-2 models directory"
+    )
+    parser.add_argument(
+        "-l",
+        "--llama-model",
+        default="tokenizers/bpe/tokenizer.model",
+        help="Path to the llama tiktoken model file",
+    )
+    parser.add_argument(
+        "-f",
+        "--hf-tokenizer",
+        default="tokenizers/hf/tokenizer.json",
+        help="Path to a HF tokenizer.json",
+    )
+    parser.add_argument(
+        "-c",
+        "--corpus",
+        action="append",
+        default=[],
+        help="Also benchmark a local text file (repeatable)",
+    )
+    parser.add_argument(
+        "-n",
+        "--megabytes",
+        type=float,
+        default=1,
+        help="Size of each generated corpus in MB (default: 1)",
+    )
+    parser.add_argument(
+        "--document-size",
+        type=int,
+        default=4096,
+        help="Approximate size of each document in characters (default: 4096)",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, help="Number of timed runs"
+    )
+    parser.add_argument("-o", "--output", help="Write the results to a JSON file")
+    return parser.parse_args()
+
+
+def get_corpora(size: int, seed: int = 1337) -> dict[str, str]:
+    rng = random.Random(seed)
+    words = "the of and to in is was for on as it's they'll 1984 2,500 $3.50".split()
+    ascii = " ".join(rng.choice(words) for _ in range(size // 4))[:size]
+    mixed_words = words + ["Ünïcödé", "日本語", "Ελληνικά", "😸", "٣٤٥", "—", "«»"]
+    mixed = " ".join(rng.choice(mixed_words) for _ in range(size // 5))[:size]
+    code_words = ["def", "self", "return", "(", ")", ":", "\n    ", "_value", "0x1f"]
+    code = "".join(rng.choice(code_words) for _ in range(size // 4))[:size]
+    return {"ascii": ascii, "mixed": mixed, "code": code}
+
+
+def split_documents(text: str, size: int) -> list[str]:
+    # Cut after the first newline or space following every `size` characters
+    documents = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        for sep in ("\n", " "):
+            cut = text.find(sep, end)
+            if cut != -1:
+                end = cut + 1
+                break
+        else:
+            end = len(text)
+        documents.append(text[start:end])
+        start = end
+    return documents
+
+
+def get_dialogs(documents: list[str], seed: int = 1337) -> list[list[dict]]:
+    rng = random.Random(seed)
+    roles = ["system", "user", "assistant"]
+    dialogs = []
+    for document in documents:
+        contents = split_documents(document, 256)
+        dialogs.append(
+            [{"role": rng.choice(roles), "content": content} for content in contents]
+        )
+    return dialogs
+
+
+def get_encoders(args: argparse.Namespace) -> Iterator[tuple[str, Callable]]:
+    """Yield the name and an encode function for each available target."""
+    if "gpt2" in args.targets:
+        model_dir = Path(args.models_dir) / args.model_name
+        if (model_dir / "encoder.json").is_file() or (
+            model_dir / "vocab.bin"
+        ).is_file():
+            from mod.gpt.encoder import Encoder
+
+            yield "gpt2", Encoder.get_encoder(args.model_name, args.models_dir).encode
+        else:
+            print(f"Skipping gpt2: no GPT-2 model in {model_dir}")
+
+    if {"llama", "chat"} & set(args.targets):
+        tokenizer = Tokenizer(args.llama_model)
+        if "llama" in args.targets:
+            yield "llama", lambda s: tokenizer.encode(s, bos=False, eos=False)
+        if "chat" in args.targets:
+            # Without a message cache, repeated runs encode every message again
+            yield "chat", ChatFormat(tokenizer, cache_size=0).encode_dialog_prompt
+
+    if "hf" in args.targets:
+        if Path(args.hf_tokenizer).is_file():
+            from tokenizers import Tokenizer as HFTokenizer
+
+            hf = HFTokenizer.from_file(args.hf_tokenizer)
+            yield "hf", lambda s: hf.encode(s, add_special_tokens=False).ids
+        else:
+            print(f"Skipping hf: {args.hf_tokenizer} does not exist")
+
+
+def run(encode: Callable, documents: list, n_bytes: int, repeat: int) -> dict:
+    """
+    Encode every document `repeat` times and once more under tracemalloc.
+
+    :return: Throughput of the fastest run, latency percentiles over all runs and
+        the peak of traced Python allocations.
+    """
+    latencies = []
+    best = float("inf")
+    n_tokens = 0
+    for _ in range(repeat):
+        n_tokens = 0
+        run_start = time.perf_counter()
+        for document in documents:
+            start = time.perf_counter()
+            n_tokens += len(encode(document))
+            latencies.append(time.perf_counter() - start)
+        best = min(best, time.perf_counter() - run_start)
+
+    tracemalloc.start()
+    for document in documents:
+        encode(document)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {
+        "documents": len(documents),
+        "bytes": n_bytes,
+        "tokens": n_tokens,
+        "seconds": best,
+        "mb_per_s": n_bytes / 1e6 / best,
+        "tokens_per_s": n_tokens / best,
+        "latency_ms": {"p50": p50, "p90": p90, "p99": p99},
+        "peak_bytes": peak,
+    }
+
+
+def get_metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def main():
+    args = get_arguments()
+    corpora = get_corpora(int(args.megabytes * 1024 * 1024))
+    for path in args.corpus:
+        corpora[Path(path).name] = Path(path).read_text(encoding="utf-8")
+    documents = {
+        name: split_documents(text, args.document_size)
+        for name, text in corpora.items()
+    }
+
+    results = []
+    print(
+        f"{'target':>6} | {'corpus':>16} | {'MB/s':>7} | {'tokens/s':>10}"
+        f" | {'p50 ms':>7} | {'p99 ms':>7} | {'peak MB':>7}"
+    )
+    for target, encode in get_encoders(args):
+        for corpus, docs in documents.items():
+            n_bytes = len(corpora[corpus].encode("utf-8"))
+            inputs = get_dialogs(docs) if target == "chat" else docs
+            result = {"target": target, "corpus": corpus}
+            result.update(run(encode, inputs, n_bytes, args.repeat))
+            results.append(result)
+            print(
+                f"{target:>6} | {corpus:>16} | {result['mb_per_s']:7.2f}"
+                f" | {result['tokens_per_s']:10.0f}"
+                f" | {result['latency_ms']['p50']:7.3f}"
+                f" | {result['latency_ms']['p99']:7.3f}"
+                f" | {result['peak_bytes'] / 1e6:7.2f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
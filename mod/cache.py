@@ -0,0 +1,115 @@
+"""
+Module: tok.cache
+
+Size-bounded caches for memoizing BPE merges of pre-tokens.
+"""
+
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, Hashable, Optional, Protocol, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+class BPECache(Protocol[K, V]):
+    """
+    Interface expected by `Encoder` for its merge cache.
+
+    Implementations must count hits and misses in `get` and evictions when
+    `__setitem__` drops entries to stay within budget.
+    """
+
+    stats: CacheStats
+
+    def get(self, key: K) -> Optional[V]:
+        """Returns the cached value, or None on a miss."""
+
+    def __setitem__(self, key: K, value: V) -> None:
+        """Caches a value, evicting entries to stay within budget."""
+
+    def __len__(self) -> int:
+        """Returns the number of cached entries."""
+
+    def clear(self) -> None:
+        """Drops every entry."""
+
+
+class LRUCache(Generic[K, V]):
+    """
+    A least recently used cache bounded by entry count and an approximate byte budget.
+
+    The byte budget is estimated with `sys.getsizeof` of each key and value, which is
+    close enough to size the cache against the RSS of a worker.
+
+    :param max_entries: Maximum number of entries, or None for no limit.
+    :param max_bytes: Maximum estimated size of keys and values, or None for no limit.
+    """
+
+    def __init__(
+        self, max_entries: Optional[int] = 65536, max_bytes: Optional[int] = None
+    ):
+        if max_entries is not None and max_entries < 0:
+            raise ValueError("max_entries must be non-negative")
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("max_bytes must be non-negative")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.nbytes = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    def get(self, key: K) -> Optional[V]:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        if key in self._data:
+            self.nbytes -= self._sizeof(key, self._data.pop(key))
+        size = self._sizeof(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # never admit an entry larger than the whole budget
+        self._data[key] = value
+        self.nbytes += size
+        while (self.max_entries is not None and len(self._data) > self.max_entries) or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            old_key, old_value = self._data.popitem(last=False)
+            self.nbytes -= self._sizeof(old_key, old_value)
+            self.stats.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def _sizeof(key: K, value: V) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
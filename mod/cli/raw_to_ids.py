@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+raw_to_ids.py - tokenize plaintext .raw files into memory-mappable token id shards
+
+Each non-empty line of a .raw file is treated as one document, which matches the
+one-row-per-line layout written by parquet_to_txt.py.
+"""
+
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import cpu_count
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+from tqdm import tqdm
+
+from ..shard import write_shard
+
+# Set once per worker process by _init_tokenizer
+_encode: Callable[[str], list[int]] = None
+
+
+def load_tokenizer(kind: str, path: str) -> tuple[Callable[[str], list[int]], int, int]:
+    """Return the encode function, vocab size and end-of-text id of a tokenizer."""
+    if kind == "gpt2":
+        from ..gpt.encoder import Encoder
+
+        model_path = Path(path)
+        encoder = Encoder.get_encoder(
+            model_path.name, str(model_path.parent), merge_engine="heap"
+        )
+        eos_id = encoder.encoder.get("<|endoftext|>", -1)
+        return encoder.encode, max(encoder.decoder) + 1, eos_id
+
+    if kind == "llama":
+        from ..llama.tokenizer import Tokenizer
+
+        tokenizer = Tokenizer(path)
+
+        def encode(text: str) -> list[int]:
+            return tokenizer.encode(text, bos=False, eos=False)
+
+        return encode, tokenizer.n_words, tokenizer.eos_id
+
+    raise ValueError(f"Unknown tokenizer: {kind}")
+
+
+def _init_tokenizer(kind: str, path: str) -> None:
+    global _encode
+    _encode, _, _ = load_tokenizer(kind, path)
+
+
+def _encode_docs(docs: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    batch = [_encode(doc) for doc in docs]
+    lengths = np.fromiter((len(ids) for ids in batch), dtype=np.int64, count=len(batch))
+    ids = np.fromiter(
+        (idx for ids in batch for idx in ids), dtype=np.uint32, count=int(lengths.sum())
+    )
+    return ids, lengths
+
+
+def read_docs(path: str, batch_size: int) -> Iterator[list[str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        lines = (line for line in f if line.strip())
+        while batch := list(islice(lines, batch_size)):
+            yield batch
+
+
+def get_raw_file_paths(path: Path) -> list[str]:
+    file_paths = []
+    for entry in os.scandir(str(path)):
+        if Path(entry.path).suffix == ".raw":
+            file_paths.append(entry.path)
+    return sorted(file_paths)
+
+
+class ShardWriter:
+    """Accumulate encoded documents and flush them into shards of bounded size."""
+
+    def __init__(
+        self, prefix: Path, vocab_size: int, shard_tokens: int, eos_id: int = -1
+    ):
+        self.prefix = prefix
+        self.vocab_size = vocab_size
+        self.shard_tokens = shard_tokens
+        self.eos_id = eos_id
+        self.paths: list[Path] = []
+        self._ids: list[np.ndarray] = []
+        self._lengths: list[np.ndarray] = []
+        self._n_tokens = 0
+
+    def add(self, ids: np.ndarray, lengths: np.ndarray) -> None:
+        if self.eos_id >= 0:
+            ends = np.cumsum(lengths)
+            ids = np.insert(ids, ends, self.eos_id)
+            lengths = lengths + 1
+        # Documents never straddle two shards; a document longer than
+        # shard_tokens gets a shard of its own
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        start = 0
+        for end in range(1, len(offsets)):
+            # tokens pending since the last cut, including document end - 1
+            pending = self._n_tokens + int(offsets[end] - offsets[start])
+            if pending > self.shard_tokens and (self._n_tokens or end - 1 > start):
+                self._append(ids, offsets, start, end - 1)
+                self.flush()
+                start = end - 1
+        self._append(ids, offsets, start, len(offsets) - 1)
+
+    def _append(self, ids: np.ndarray, offsets: np.ndarray, start: int, end: int):
+        if start == end:
+            return
+        self._ids.append(ids[offsets[start] : offsets[end]])
+        self._lengths.append(np.diff(offsets[start : end + 1]))
+        self._n_tokens += int(offsets[end] - offsets[start])
+
+    def flush(self) -> None:
+        if not self._lengths:
+            return
+        path = self.prefix.with_name(f"{self.prefix.name}-{len(self.paths):05d}.bin")
+        lengths = np.concatenate(self._lengths)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.uint64)
+        np.cumsum(lengths, out=offsets[1:])
+        write_shard(path, np.concatenate(self._ids), offsets, self.vocab_size)
+        self.paths.append(path)
+        self._ids, self._lengths, self._n_tokens = [], [], 0
+
+
+def raw_to_ids(
+    raw_path: str,
+    output_dir: Path,
+    kind: str,
+    tokenizer_path: str,
+    num_workers: int,
+    batch_size: int,
+    shard_tokens: int,
+    append_eos: bool,
+) -> list[Path]:
+    _, vocab_size, eos_id = load_tokenizer(kind, tokenizer_path)
+    writer = ShardWriter(
+        output_dir / Path(raw_path).stem,
+        vocab_size,
+        shard_tokens,
+        eos_id if append_eos else -1,
+    )
+
+    with ProcessPoolExecutor(
+        num_workers, initializer=_init_tokenizer, initargs=(kind, tokenizer_path)
+    ) as pool:
+        # Keep a bounded number of batches in flight so large files are streamed
+        pending = deque()
+        for docs in tqdm(read_docs(raw_path, batch_size), desc=Path(raw_path).name):
+            pending.append(pool.submit(_encode_docs, docs))
+            if len(pending) >= 2 * num_workers:
+                writer.add(*pending.popleft().result())
+        while pending:
+            writer.add(*pending.popleft().result())
+
+    writer.flush()
+    return writer.paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tokenize .raw plaintext files into token id shards"
+    )
+    parser.add_argument(
+        "-d",
+        "--dir-path",
+        default="data/wikitext-103-raw-v1",
+        help="The directory to the dataset",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="The directory to write shards to (default: <dir-path>/ids)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tokenizer",
+        choices=["gpt2", "llama"],
+        default="llama",
+        help="The tokenizer type (default: llama)",
+    )
+    parser.add_argument(
+        "-p",
+        "--tokenizer-path",
+        default="tokenizers/bpe/tokenizer.model",
+        help="The llama tokenizer.model or the GPT-2 model directory",
+    )
+    parser.add_argument(
+        "-n",
+        "--num-workers",
+        type=int,
+        default=cpu_count(),
+        help="Number of worker processes (default: all cores)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1024,
+        help="Number of documents per worker task (default: 1024)",
+    )
+    parser.add_argument(
+        "--shard-tokens",
+        type=int,
+        default=1 << 28,
+        help="Maximum number of tokens per shard (default: 268435456)",
+    )
+    parser.add_argument(
+        "--append-eos",
+        action="store_true",
+        help="Append the end-of-text token to every document",
+    )
+
+    args = parser.parse_args()
+    path = Path(args.dir_path)
+    if not path.is_dir():
+        raise FileNotFoundError(f"{path} does not exist!")
+
+    output_dir = Path(args.output_dir) if args.output_dir else path / "ids"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    for raw in get_raw_file_paths(path):
+        for shard in raw_to_ids(
+            raw,
+            output_dir,
+            args.tokenizer,
+            args.tokenizer_path,
+            args.num_workers,
+            args.batch_size,
+            args.shard_tokens,
+            args.append_eos,
+        ):
+            print(f"Wrote {shard}")
+
+
+if __name__ == "__main__":
+    main()
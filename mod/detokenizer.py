@@ -0,0 +1,49 @@
+"""
+Module: tok.detokenizer
+
+Incremental detokenization for printing generated text token by token.
+"""
+
+import codecs
+from typing import Callable
+
+
+class IncrementalDecoder:
+    """
+    Decode token ids one at a time, emitting only newly completed text.
+
+    Byte-level tokens may end in the middle of a UTF-8 sequence; the trailing bytes
+    are buffered until the sequence is complete, so the work per token is constant
+    instead of re-decoding the whole sequence at every step.
+
+    :param token_bytes: Returns the raw bytes of a token id.
+    :param errors: How to handle invalid UTF-8 sequences (default: "replace").
+    """
+
+    def __init__(self, token_bytes: Callable[[int], bytes], errors: str = "replace"):
+        self.token_bytes = token_bytes
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors=errors)
+
+    def push(self, token: int) -> str:
+        """
+        Add a token id to the stream.
+
+        :param token: The next token id.
+
+        :return: The text completed by this token, possibly empty.
+        """
+        return self._decoder.decode(self.token_bytes(token))
+
+    def flush(self) -> str:
+        """
+        End the stream, decoding any buffered incomplete sequence.
+
+        :return: The remaining text, or "" if nothing is buffered.
+        """
+        text = self._decoder.decode(b"", final=True)
+        self._decoder.reset()
+        return text
+
+    def reset(self) -> None:
+        """Discard any buffered bytes."""
+        self._decoder.reset()
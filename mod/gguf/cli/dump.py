@@ -97,8 +97,9 @@ def dump_metadata_json(reader: GGUFReader, args: argparse.Namespace) -> None:
             curr["array_types"] = [t.name for t in field.types][1:]
             if not args.json_array:
                 continue
-            itype = field.types[-1]
-            if itype == GGUFValueType.STRING:
+            if len(field.types) == 2:
+                curr["value"] = field.get_value()
+            elif field.types[-1] == GGUFValueType.STRING:
                 curr["value"] = [
                     str(bytes(field.parts[idx]), encoding="utf-8") for idx in field.data
                 ]
@@ -106,10 +107,8 @@ def dump_metadata_json(reader: GGUFReader, args: argparse.Namespace) -> None:
                 curr["value"] = [
                     pv for idx in field.data for pv in field.parts[idx].tolist()
                 ]
-        elif field.types[0] == GGUFValueType.STRING:
-            curr["value"] = str(bytes(field.parts[-1]), encoding="utf-8")
         else:
-            curr["value"] = field.parts[-1].tolist()[0]
+            curr["value"] = field.get_value()
     if not args.no_tensors:
         for idx, tensor in enumerate(reader.tensors):
             tensors[tensor.name] = {
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Module: tok.gguf.cli.scan
+
+Scan many GGUF files in parallel and summarize each one in a single JSON or CSV table.
+
+Files are opened lazily by GGUFReader, so only the key/value and tensor info records
+are read; tensor data pages are never touched and scanning a directory of large
+models stays cheap on I/O.
+
+Usage:
+    python -m mod.gguf.cli.scan models -j 8 --format csv -o models.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from pathlib import Path
+from typing import Any, Iterator
+
+from ..constants import GGUF_FILE_TYPE_NAMES, GGUFFileType, GGUFMetadataKeys
+from ..reader import GGUFReader
+from .dump import get_file_host_endian
+
+logger = logging.getLogger("gguf-scan")
+
+COLUMNS = [
+    "path",
+    "file_size",
+    "endian",
+    "architecture",
+    "name",
+    "file_type",
+    "tensor_count",
+    "tensor_bytes",
+    "vocab_size",
+    "kv_count",
+    "error",
+]
+
+# Token lists written by this repo and by llama.cpp
+VOCAB_KEYS = [GGUFMetadataKeys.Tokenizer.VOCAB, "tokenizer.ggml.tokens"]
+
+
+def get_file_type(reader: GGUFReader) -> str | None:
+    """
+    Returns the name of general.file_type, or of the tensor type holding the most
+    bytes when the file does not record it.
+    """
+    field = reader.get_field(GGUFMetadataKeys.General.FILE_TYPE)
+    if field is not None:
+        value = field.get_value()
+        try:
+            file_type = GGUFFileType(value)
+        except ValueError:
+            return str(value)
+        return GGUF_FILE_TYPE_NAMES.get(file_type, file_type.name)
+    type_bytes: Counter[str] = Counter()
+    for tensor in reader.tensors:
+        type_bytes[tensor.tensor_type.name] += tensor.n_bytes
+    return type_bytes.most_common(1)[0][0] if type_bytes else None
+
+
+def get_vocab_size(reader: GGUFReader, arch: str | None) -> int | None:
+    if arch is not None:
+        field = reader.get_field(GGUFMetadataKeys.LLM.VOCAB_SIZE.format(arch=arch))
+        if field is not None:
+            return field.get_value()
+    for key in VOCAB_KEYS:
+        field = reader.get_field(key)
+        if field is not None:
+            return field.get_array_length()
+    return None
+
+
+def scan_file(path: str, keys: list[str] | None = None) -> dict[str, Any]:
+    """
+    Reads the summary of a GGUF file without touching its tensor data.
+
+    :param path: The GGUF file path.
+    :param keys: Extra metadata keys to include as columns.
+    :return: A row of `COLUMNS` plus `keys`; `error` is set if the file can't be read.
+    """
+    row: dict[str, Any] = dict.fromkeys(COLUMNS + (keys or []))
+    row["path"] = path
+    try:
+        row["file_size"] = os.path.getsize(path)
+        reader = GGUFReader(path, lazy=True)
+        _, row["endian"] = get_file_host_endian(reader)
+        arch = reader.get_field(GGUFMetadataKeys.General.ARCHITECTURE)
+        row["architecture"] = arch.get_value() if arch is not None else None
+        name = reader.get_field(GGUFMetadataKeys.General.NAME)
+        row["name"] = name.get_value() if name is not None else None
+        row["file_type"] = get_file_type(reader)
+        row["tensor_count"] = len(reader.tensors)
+        row["tensor_bytes"] = sum(tensor.n_bytes for tensor in reader.tensors)
+        row["vocab_size"] = get_vocab_size(reader, row["architecture"])
+        row["kv_count"] = reader.get_field("GGUF.kv_count").get_value()
+        for key in keys or []:
+            field = reader.get_field(key)
+            row[key] = field.get_value() if field is not None else None
+    except Exception as e:  # report unreadable files and keep scanning
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _scan_file(args: tuple[str, list[str]]) -> dict[str, Any]:
+    return scan_file(*args)
+
+
+def find_files(paths: list[str]) -> Iterator[str]:
+    """Yields the given files, and every .gguf file under the given directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(str(p) for p in Path(path).rglob("*.gguf"))
+        else:
+            yield path
+
+
+def scan(
+    paths: list[str], keys: list[str], num_workers: int
+) -> Iterator[dict[str, Any]]:
+    """Scans the files in a process pool, yielding rows in the order of `paths`."""
+    if num_workers <= 1 or len(paths) <= 1:
+        yield from (scan_file(path, keys) for path in paths)
+        return
+    with ProcessPoolExecutor(num_workers) as pool:
+        # Headers are small, so batch several files per task
+        chunksize = max(1, len(paths) // (4 * num_workers))
+        yield from pool.map(
+            _scan_file, [(path, keys) for path in paths], chunksize=chunksize
+        )
+
+
+def write_rows(rows: list[dict[str, Any]], columns: list[str], fmt: str, f) -> None:
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=columns, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(
+                {
+                    key: json.dumps(value) if isinstance(value, list) else value
+                    for key, value in row.items()
+                }
+            )
+    else:
+        json.dump(rows, f, indent=2)
+        f.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Summarize many GGUF files without reading their tensor data"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="GGUF files, or directories to search for .gguf files"
+    )
+    parser.add_argument(
+        "-k",
+        "--key",
+        action="append",
+        default=[],
+        help="Also extract a metadata key, e.g. llama.context_length (repeatable)",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=["json", "csv"],
+        default="json",
+        help="Output format (default: json)",
+    )
+    parser.add_argument("-o", "--output", help="Write the table to a file")
+    parser.add_argument(
+        "-j",
+        "--num-workers",
+        type=int,
+        default=cpu_count(),
+        help="Number of worker processes (default: all cores)",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="increase output verbosity"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    paths = list(find_files(args.paths))
+    start = time.perf_counter()
+    rows = []
+    for row in scan(paths, args.key, args.num_workers):
+        if row["error"]:
+            logger.warning(f"{row['path']}: {row['error']}")
+        else:
+            logger.debug(f"Scanned {row['path']}")
+        rows.append(row)
+    elapsed = time.perf_counter() - start
+
+    columns = COLUMNS + [key for key in args.key if key not in COLUMNS]
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_rows(rows, columns, args.format, f)
+    else:
+        write_rows(rows, columns, args.format, sys.stdout)
+
+    n_bytes = sum(row["file_size"] or 0 for row in rows)
+    n_errors = sum(1 for row in rows if row["error"])
+    logger.info(
+        f"* Scanned {len(rows)} file(s) ({n_errors} failed), {n_bytes / 1e9:.2f} GB"
+        f" of models in {elapsed:.3f}s: {len(rows) / max(elapsed, 1e-9):.1f} files/s,"
+        f" {n_bytes / 1e9 / max(elapsed, 1e-9):.2f} GB/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,14 @@
 #
 from __future__ import annotations
 
+import fnmatch
 import logging
 import os
+import re
+import struct
+import sys
 from collections import OrderedDict
+from collections.abc import Iterator, Mapping, Sequence
 from typing import Any, Literal, NamedTuple, TypeVar, Union
 
 import numpy as np
@@ -15,7 +20,6 @@ import numpy.typing as npt
 from .quants import quant_shape_to_byte_shape
 
 if __name__ == "__main__":
-    import sys
     from pathlib import Path
 
     # Allow running file in package as a script.
@@ -34,24 +38,139 @@ logger = logging.getLogger(__name__)
 
 READER_SUPPORTED_VERSIONS = [2, GGUF_VERSION]
 
+# Block tensors are named like blk.{bid}.attn_q, see GGUF_TENSOR_NAMES
+BLOCK_TENSOR_NAME = re.compile(r"blk\.(\d+)\.")
 
-class ReaderField(NamedTuple):
-    # Offset to start of this field.
-    offset: int
 
-    # Name of the field (not necessarily from file data).
-    name: str
+class ReaderField:
+    """
+    A key/value field, or the info record of a tensor.
+
+    Key/value fields read from the file only keep their offset and types. The `parts`
+    and `data` views are built on first access, while `get_value()` and `get_array()`
+    decode the value straight from the file, so memory is proportional to the number
+    of fields, not to the number of array elements.
+    """
+
+    __slots__ = ("offset", "name", "types", "_parts", "_data", "_reader")
+
+    def __init__(
+        self,
+        offset: int,
+        name: str,
+        parts: Sequence[npt.NDArray[Any]] | None = None,
+        data: Sequence[int] | None = None,
+        types: list[GGUFValueType] | None = None,
+        reader: GGUFReader | None = None,
+    ):
+        # Offset to start of this field.
+        self.offset = offset
 
-    # Data parts. Some types have multiple components, such as strings
-    # that consist of a length followed by the string data.
-    parts: list[npt.NDArray[Any]] = []
+        # Name of the field (not necessarily from file data).
+        self.name = name
 
-    # Indexes into parts that we can call the actual data. For example
-    # an array of strings will be populated with indexes to the actual
-    # string data.
-    data: list[int] = [-1]
+        self.types: list[GGUFValueType] = types if types is not None else []
 
-    types: list[GGUFValueType] = []
+        # Data parts and indexes into them, see `parts` and `data`. Both are built
+        # from `reader` when not given.
+        self._parts = parts if parts is not None or reader else []
+        self._data = data if data is not None or reader else [-1]
+        self._reader = reader
+
+    def __repr__(self) -> str:
+        return (
+            f"ReaderField(offset={self.offset}, name={self.name!r}, "
+            f"types={[t.name for t in self.types]})"
+        )
+
+    @property
+    def parts(self) -> Sequence[npt.NDArray[Any]]:
+        """
+        Data parts. Some types have multiple components, such as strings
+        that consist of a length followed by the string data.
+        """
+        if self._parts is None:
+            self._parts, self._data = self._reader._build_field_parts(self.offset)
+        return self._parts
+
+    @property
+    def data(self) -> Sequence[int]:
+        """
+        Indexes into parts that we can call the actual data. For example
+        an array of strings will be populated with indexes to the actual
+        string data.
+        """
+        if self._data is None:
+            self._parts, self._data = self._reader._build_field_parts(self.offset)
+        return self._data
+
+    def get_value(self) -> Any:
+        """
+        Decodes the value of the field.
+
+        :return: A Python scalar or str, or a list of them for arrays.
+
+        :raises ValueError: If the field has no value type, e.g. a tensor info record.
+        """
+        if not self.types:
+            raise ValueError(f"Field {self.name} has no value type")
+        if self._reader is not None:
+            value, _ = self._reader._decode_value(
+                self._reader._field_value_offset(self.offset), self.types[0]
+            )
+            return value
+        values = [
+            (
+                str(bytes(self.parts[idx]), encoding="utf-8")
+                if self.types[-1] == GGUFValueType.STRING
+                else self.parts[idx].tolist()[0]
+            )
+            for idx in self.data
+        ]
+        return values if self.types[:1] == [GGUFValueType.ARRAY] else values[0]
+
+    def get_array_length(self) -> int:
+        """
+        Returns the number of elements of an array field without reading them.
+
+        :return: The array length.
+
+        :raises ValueError: If the field is not an array.
+        """
+        if self.types[:1] != [GGUFValueType.ARRAY]:
+            raise ValueError(f"Field {self.name} is not an array")
+        if self._reader is not None:
+            return self._reader._array_length(
+                self._reader._field_value_offset(self.offset)
+            )
+        return len(self.data)
+
+    def get_array(self) -> npt.NDArray[Any]:
+        """
+        Returns the value of an array field as a NumPy array.
+
+        :return: A typed view into the file for arrays of scalars, or an object array
+            of str for arrays of strings.
+
+        :raises ValueError: If the field is not an array.
+        """
+        if self.types[:1] != [GGUFValueType.ARRAY]:
+            raise ValueError(f"Field {self.name} is not an array")
+        if self._reader is not None:
+            bulk = self._reader._read_array(
+                self._reader._field_value_offset(self.offset)
+            )
+            if bulk is not None and not bulk.is_string:
+                return bulk.values
+            if bulk is not None:
+                values = bulk.tolist()
+            else:
+                values = self.get_value()
+        else:
+            values = self.get_value()
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
 
 
 class ReaderTensor(NamedTuple):
@@ -65,6 +184,170 @@ class ReaderTensor(NamedTuple):
     field: ReaderField
 
 
+class ReaderArrayParts(Sequence[npt.NDArray[Any]]):
+    """
+    The parts of an array of strings or scalars, held in bulk.
+
+    Indexing returns the same per-element views as the parts list of any other field,
+    built on access. The whole array is available at once as `values`, a single typed
+    array for scalars, or as `buffer` and `offsets` for strings, where string `i` is
+    `buffer[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(
+        self,
+        reader: GGUFReader,
+        head: list[npt.NDArray[Any]],
+        values: npt.NDArray[Any] | None = None,
+        starts: npt.NDArray[np.int64] | None = None,
+        lengths: npt.NDArray[np.int64] | None = None,
+    ):
+        self._reader = reader
+        # The parts before the elements, e.g. the key and the array type and length
+        self.head = head
+        self.values = values
+        # Offsets of the data of each string in the file and their lengths
+        self._starts = starts
+        self._lengths = lengths
+        self._buffer: npt.NDArray[np.uint8] | None = None
+
+    @property
+    def is_string(self) -> bool:
+        return self._starts is not None
+
+    @property
+    def n_elements(self) -> int:
+        return len(self._starts) if self.is_string else len(self.values)
+
+    @property
+    def offsets(self) -> npt.NDArray[np.int64]:
+        offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=offsets[1:])
+        return offsets
+
+    @property
+    def buffer(self) -> npt.NDArray[np.uint8]:
+        """The bytes of every string, concatenated."""
+        if self._buffer is None:
+            offsets = self.offsets
+            # The file offset of every byte to keep, skipping the length prefixes
+            index = np.arange(offsets[-1], dtype=np.int64)
+            index += np.repeat(self._starts - offsets[:-1], self._lengths)
+            self._buffer = np.asarray(self._reader.data[index])
+        return self._buffer
+
+    def __len__(self) -> int:
+        per_element = 2 if self.is_string else 1
+        return len(self.head) + per_element * self.n_elements
+
+    def __getitem__(
+        self, idx: int | slice
+    ) -> npt.NDArray[Any] | list[npt.NDArray[Any]]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = range(len(self))[idx]  # bounds check, negative indexes
+        if idx < len(self.head):
+            return self.head[idx]
+        idx -= len(self.head)
+        if not self.is_string:
+            return self.values[idx : idx + 1]
+        start = int(self._starts[idx // 2])
+        if idx % 2 == 0:
+            return self._reader._get(start - 8, np.uint64)
+        return self._reader._get(start, np.uint8, self._lengths[idx // 2])
+
+    def __iter__(self) -> Iterator[npt.NDArray[Any]]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(part.nbytes) for part in self.head) + self.data_nbytes
+
+    @property
+    def data_nbytes(self) -> int:
+        if self.is_string:
+            return 8 * self.n_elements + int(self._lengths.sum())
+        return int(self.values.nbytes)
+
+    def tolist(self) -> list[Any]:
+        """Decodes every element, strings as str."""
+        if not self.is_string:
+            return self.values.tolist()
+        blob = self.buffer.tobytes()
+        bounds = self.offsets.tolist()
+        return [
+            blob[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])
+        ]
+
+    def prepend(self, parts: list[npt.NDArray[Any]]) -> ReaderArrayParts:
+        return ReaderArrayParts(
+            self._reader, parts + self.head, self.values, self._starts, self._lengths
+        )
+
+
+class LazyFields(Mapping[str, ReaderField]):
+    """
+    Key/value fields of a lazily opened GGUFReader, read from the file on first access.
+
+    Only the offset of each field is kept until the field is looked up.
+    """
+
+    def __init__(
+        self,
+        reader: GGUFReader,
+        offsets: dict[str, int],
+        fields: dict[str, ReaderField] | None = None,
+    ):
+        self._reader = reader
+        self._offsets = offsets
+        self._fields: dict[str, ReaderField] = dict(fields or {})
+
+    def __getitem__(self, key: str) -> ReaderField:
+        field = self._fields.get(key)
+        if field is None:
+            # The key differs from the name in the file for renamed duplicate keys
+            field, _ = self._reader._build_field(self._offsets[key], key)
+            self._fields[key] = field
+        return field
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
+class LazyTensors(Sequence[ReaderTensor]):
+    """
+    Tensors of a lazily opened GGUFReader, read from the file on first access.
+
+    Only the offset of each tensor info record is kept until the tensor is looked up.
+    """
+
+    def __init__(self, reader: GGUFReader, offsets: list[int], start_offs: int):
+        self._reader = reader
+        self._offsets = offsets
+        self._start_offs = start_offs
+        self._tensors: dict[int, ReaderTensor] = {}
+
+    def __getitem__(self, idx: int | slice) -> ReaderTensor | list[ReaderTensor]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = range(len(self._offsets))[idx]  # bounds check, negative indexes
+        tensor = self._tensors.get(idx)
+        if tensor is None:
+            field = self._reader._get_tensor(self._offsets[idx])
+            tensor = self._reader._build_tensor(self._start_offs, field)
+            self._tensors[idx] = tensor
+        return tensor
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
 class GGUFReader:
     # I - same as host, S - swapped
     byte_order: Literal["I"] | Literal["S"] = "I"
@@ -89,7 +372,15 @@ class GGUFReader:
         self,
         path: os.PathLike[str] | str,
         mode: Literal["r"] | Literal["r+"] | Literal["c"] = "r",
+        lazy: bool = False,
     ):
+        """
+        :param path: The GGUF file path.
+        :param mode: The memmap mode of the file.
+        :param lazy: Only index the offsets of the fields and tensor infos, and read
+            each field and tensor when it is first accessed. Tensor data pages are
+            never touched until a tensor's data is used.
+        """
         self.data = np.memmap(path, mode=mode)
         offs = 0
         if self._get(offs, np.uint32, override_order="<")[0] != GGUF_MAGIC:
@@ -106,8 +397,16 @@ class GGUFReader:
             raise ValueError(
                 f"Sorry, file appears to be version {version} which we cannot handle"
             )
-        self.fields: OrderedDict[str, ReaderField] = OrderedDict()
-        self.tensors: list[ReaderTensor] = []
+        # struct byte order of the file
+        if self.byte_order == "S":
+            self._struct_order = ">" if sys.byteorder == "little" else "<"
+        else:
+            self._struct_order = "="
+        self.fields: OrderedDict[str, ReaderField] | LazyFields = OrderedDict()
+        self.tensors: list[ReaderTensor] | LazyTensors = []
+        # Index of each tensor by name, and of each block's tensors by block id
+        self._tensor_index: dict[str, int] = {}
+        self._block_index: dict[int, list[int]] | None = None
         offs += self._push_field(
             ReaderField(
                 offs, "GGUF.version", [temp_version], [0], [GGUFValueType.UINT32]
@@ -129,17 +428,34 @@ class GGUFReader:
             )
         )
         tensor_count, kv_count = temp_counts
-        offs = self._build_fields(offs, kv_count)
-        offs, tensors_fields = self._build_tensors_fields(offs, tensor_count)
+        if lazy:
+            # The header fields are already built
+            header_fields = self.fields
+            offs, field_offsets = self._index_fields(offs, kv_count)
+            offs, tensor_offsets = self._index_tensors(offs, tensor_count)
+            self.fields = LazyFields(
+                self,
+                {
+                    **{key: field.offset for key, field in header_fields.items()},
+                    **field_offsets,
+                },
+                header_fields,
+            )
+        else:
+            offs = self._build_fields(offs, kv_count)
+            offs, tensors_fields = self._build_tensors_fields(offs, tensor_count)
         new_align = self.fields.get("general.alignment")
         if new_align is not None:
             if new_align.types != [GGUFValueType.UINT32]:
                 raise ValueError("Bad type for general.alignment field")
-            self.alignment = new_align.parts[-1][0]
+            self.alignment = new_align.get_value()
         padding = offs % self.alignment
         if padding != 0:
             offs += self.alignment - padding
-        self._build_tensors(offs, tensors_fields)
+        if lazy:
+            self.tensors = LazyTensors(self, tensor_offsets, offs)
+        else:
+            self._build_tensors(offs, tensors_fields)
 
     _DT = TypeVar("_DT", bound=npt.DTypeLike)
 
@@ -151,6 +467,48 @@ class GGUFReader:
     def get_tensor(self, idx: int) -> ReaderTensor:
         return self.tensors[idx]
 
+    # Fetch a tensor by name.
+    def get_tensor_by_name(self, name: str) -> Union[ReaderTensor, None]:
+        idx = self._tensor_index.get(name)
+        return None if idx is None else self.tensors[idx]
+
+    def filter_tensors(self, pattern: str | re.Pattern[str]) -> list[ReaderTensor]:
+        """
+        Fetch the tensors whose names match a pattern, in file order.
+
+        :param pattern: A glob pattern matched against the whole name, such as
+            `blk.*.attn_q.weight`, or a compiled regular expression searched in it.
+        """
+        if isinstance(pattern, str):
+            pattern = re.compile(fnmatch.translate(pattern))
+            match = pattern.match
+        else:
+            match = pattern.search
+        return [
+            self.tensors[idx] for name, idx in self._tensor_index.items() if match(name)
+        ]
+
+    def get_block_tensors(self, bid: int) -> list[ReaderTensor]:
+        """Fetch the tensors of block `bid`, named `blk.{bid}.*`, in file order."""
+        return [self.tensors[idx] for idx in self._get_block_index().get(bid, [])]
+
+    def get_blocks(self) -> dict[int, list[ReaderTensor]]:
+        """Group the tensors of every block by block id, in ascending order."""
+        return {
+            bid: [self.tensors[idx] for idx in idxs]
+            for bid, idxs in sorted(self._get_block_index().items())
+        }
+
+    def _get_block_index(self) -> dict[int, list[int]]:
+        if self._block_index is None:
+            block_index: dict[int, list[int]] = {}
+            for name, idx in self._tensor_index.items():
+                match = BLOCK_TENSOR_NAME.match(name)
+                if match is not None:
+                    block_index.setdefault(int(match.group(1)), []).append(idx)
+            self._block_index = block_index
+        return self._block_index
+
     def _get(
         self,
         offset: int,
@@ -167,6 +525,70 @@ class GGUFReader:
             .newbyteorder(override_order or self.byte_order)
         )
 
+    def _unpack(self, fmt: str, offset: int) -> tuple[Any, ...]:
+        return struct.unpack_from(self._struct_order + fmt, self.data, offset)
+
+    def _skip_str(self, offset: int) -> int:
+        return offset + 8 + self._unpack("Q", offset)[0]
+
+    def _skip_value(self, offset: int, raw_type: int) -> int:
+        """Returns the offset after a value, without building any views of it."""
+        gtype = GGUFValueType(raw_type)
+        if gtype == GGUFValueType.STRING:
+            return self._skip_str(offset)
+        nptype = self.gguf_scalar_to_np.get(gtype)
+        if nptype is not None:
+            return offset + np.dtype(nptype).itemsize
+        if gtype == GGUFValueType.ARRAY:
+            raw_itype, alen = self._unpack("IQ", offset)
+            offset += 12
+            itype = GGUFValueType(raw_itype)
+            nptype = self.gguf_scalar_to_np.get(itype)
+            if nptype is not None:
+                return offset + alen * np.dtype(nptype).itemsize
+            if itype == GGUFValueType.STRING:
+                # A tight loop over the string lengths, e.g. for tokenizer.ggml.tokens
+                unpack = struct.Struct(self._struct_order + "Q").unpack_from
+                buffer = memoryview(self.data)
+                for _ in range(alen):
+                    offset += 8 + unpack(buffer, offset)[0]
+                return offset
+            for _ in range(alen):
+                offset = self._skip_value(offset, raw_itype)
+            return offset
+        raise ValueError(f"Unknown/unhandled field type {gtype}")
+
+    def _index_fields(self, offs: int, count: int) -> tuple[int, dict[str, int]]:
+        offsets: dict[str, int] = {}
+        for _ in range(count):
+            orig_offs = offs
+            offs = self._skip_str(offs)
+            name = bytes(self.data[orig_offs + 8 : offs]).decode("utf-8")
+            (raw_kv_type,) = self._unpack("I", offs)
+            offs = self._skip_value(offs + 4, raw_kv_type)
+            if name in offsets:
+                logger.warning(f"Duplicate key {name} at offset {orig_offs}")
+                name = name + "_{}".format(orig_offs)
+            offsets[name] = orig_offs
+        return offs, offsets
+
+    def _index_tensors(self, offs: int, count: int) -> tuple[int, list[int]]:
+        offsets: list[int] = []
+        tensor_index = {}  # keep track of name to prevent duplicated tensors
+        for idx in range(count):
+            offsets.append(offs)
+            name_offs = offs
+            offs = self._skip_str(offs)
+            tensor_name = bytes(self.data[name_offs + 8 : offs]).decode("utf-8")
+            if tensor_name in tensor_index:
+                raise ValueError(f"Found duplicated tensor with name {tensor_name}")
+            tensor_index[tensor_name] = idx
+            (n_dims,) = self._unpack("I", offs)
+            # dims, then the type and the data offset
+            offs += 4 + 8 * n_dims + 4 + 8
+        self._tensor_index = tensor_index
+        return offs, offsets
+
     def _push_field(self, field: ReaderField, skip_sum: bool = False) -> int:
         if field.name in self.fields:
             # TODO: add option to generate error on duplicate keys
@@ -209,6 +631,14 @@ class GGUFReader:
             offs += int(raw_itype.nbytes)
             alen = self._get(offs, np.uint64)
             offs += int(alen.nbytes)
+            bulk = self._get_array_parts(offs, raw_itype, alen)
+            if bulk is not None:
+                # Only the types of the first element are kept, like below
+                if alen[0]:
+                    types.append(GGUFValueType(raw_itype[0]))
+                per_element = 2 if bulk.is_string else 1
+                data = range(len(bulk.head) + per_element - 1, len(bulk), per_element)
+                return offs - orig_offs + bulk.data_nbytes, bulk, data, types
             aparts: list[npt.NDArray[Any]] = [raw_itype, alen]
             data_idxs: list[int] = []
             for idx in range(alen[0]):
@@ -225,6 +655,82 @@ class GGUFReader:
         # We can't deal with this one.
         raise ValueError("Unknown/unhandled field type {gtype}")
 
+    def _get_array_parts(
+        self,
+        offs: int,
+        raw_itype: npt.NDArray[np.uint32],
+        alen: npt.NDArray[np.uint64],
+    ) -> ReaderArrayParts | None:
+        """
+        Reads an array of strings or scalars in bulk, or returns None for other arrays.
+        """
+        itype = GGUFValueType(raw_itype[0])
+        nptype = self.gguf_scalar_to_np.get(itype)
+        if nptype is not None:
+            return ReaderArrayParts(
+                self, [raw_itype, alen], values=self._get(offs, nptype, alen[0])
+            )
+        if itype != GGUFValueType.STRING:
+            return None
+        # A tight loop over the string lengths, the only part which is sequential
+        unpack = struct.Struct(self._struct_order + "Q").unpack_from
+        buffer = memoryview(self.data)
+        starts = np.empty(int(alen[0]), dtype=np.int64)
+        lengths = np.empty(int(alen[0]), dtype=np.int64)
+        for i in range(len(starts)):
+            (length,) = unpack(buffer, offs)
+            offs += 8
+            starts[i] = offs
+            lengths[i] = length
+            offs += length
+        return ReaderArrayParts(self, [raw_itype, alen], starts=starts, lengths=lengths)
+
+    def _array_length(self, offs: int) -> int:
+        """Returns the number of elements of an array from its 12 byte header."""
+        return self._unpack("IQ", offs)[1]
+
+    def _read_array(self, offs: int) -> ReaderArrayParts | None:
+        raw_itype = self._get(offs, np.uint32)
+        alen = self._get(offs + 4, np.uint64)
+        return self._get_array_parts(offs + 12, raw_itype, alen)
+
+    def _value_types(self, offs: int, raw_type: int) -> list[GGUFValueType]:
+        """Returns the types of a value, like `_get_field_parts`, without its parts."""
+        gtype = GGUFValueType(raw_type)
+        if gtype != GGUFValueType.ARRAY:
+            return [gtype]
+        raw_itype, alen = self._unpack("IQ", offs)
+        if not alen:
+            return [gtype]
+        return [gtype] + self._value_types(offs + 12, raw_itype)
+
+    def _decode_value(self, offs: int, raw_type: int) -> tuple[Any, int]:
+        """Decodes a value to Python objects and returns it with the offset after it."""
+        gtype = GGUFValueType(raw_type)
+        if gtype == GGUFValueType.STRING:
+            end = self._skip_str(offs)
+            return str(bytes(self.data[offs + 8 : end]), encoding="utf-8"), end
+        nptype = self.gguf_scalar_to_np.get(gtype)
+        if nptype is not None:
+            val = self._get(offs, nptype)
+            return val.tolist()[0], offs + int(val.nbytes)
+        if gtype == GGUFValueType.ARRAY:
+            bulk = self._read_array(offs)
+            if bulk is not None:
+                return bulk.tolist(), offs + 12 + bulk.data_nbytes
+            raw_itype, alen = self._unpack("IQ", offs)
+            offs += 12
+            values = []
+            for _ in range(alen):
+                value, offs = self._decode_value(offs, raw_itype)
+                values.append(value)
+            return values, offs
+        raise ValueError(f"Unknown/unhandled field type {gtype}")
+
+    def _field_value_offset(self, orig_offs: int) -> int:
+        # After the key and the value type
+        return self._skip_str(orig_offs) + 4
+
     def _get_tensor(self, orig_offs: int) -> ReaderField:
         offs = orig_offs
         name_len, name_data = self._get_str(offs)
@@ -244,30 +750,51 @@ class GGUFReader:
             [1, 3, 4, 5],
         )
 
-    def _build_fields(self, offs: int, count: int) -> int:
-        for _ in range(count):
-            orig_offs = offs
-            kv_klen, kv_kdata = self._get_str(offs)
-            offs += int(kv_klen.nbytes + kv_kdata.nbytes)
-            raw_kv_type = self._get(offs, np.uint32)
-            offs += int(raw_kv_type.nbytes)
-            parts: list[npt.NDArray[Any]] = [kv_klen, kv_kdata, raw_kv_type]
-            idxs_offs = len(parts)
-            field_size, field_parts, field_idxs, field_types = self._get_field_parts(
-                offs, raw_kv_type[0]
+    def _build_field(
+        self, orig_offs: int, name: str | None = None
+    ) -> tuple[ReaderField, int]:
+        """
+        Builds a compact field without parts, and returns it with the offset after it.
+        """
+        offs = self._skip_str(orig_offs)
+        if name is None:
+            name = str(bytes(self.data[orig_offs + 8 : offs]), encoding="utf-8")
+        (raw_kv_type,) = self._unpack("I", offs)
+        offs += 4
+        types = self._value_types(offs, raw_kv_type)
+        field = ReaderField(orig_offs, name, types=types, reader=self)
+        return field, self._skip_value(offs, raw_kv_type)
+
+    def _build_field_parts(
+        self, orig_offs: int
+    ) -> tuple[Sequence[npt.NDArray[Any]], Sequence[int]]:
+        offs = orig_offs
+        kv_klen, kv_kdata = self._get_str(offs)
+        offs += int(kv_klen.nbytes + kv_kdata.nbytes)
+        raw_kv_type = self._get(offs, np.uint32)
+        offs += int(raw_kv_type.nbytes)
+        parts: list[npt.NDArray[Any]] = [kv_klen, kv_kdata, raw_kv_type]
+        idxs_offs = len(parts)
+        field_size, field_parts, field_idxs, field_types = self._get_field_parts(
+            offs, raw_kv_type[0]
+        )
+        if isinstance(field_parts, ReaderArrayParts):
+            # Keep the array in bulk; its indexes are a range
+            parts = field_parts.prepend(parts)
+            data = range(
+                field_idxs.start + idxs_offs,
+                field_idxs.stop + idxs_offs,
+                field_idxs.step,
             )
+        else:
             parts += field_parts
-            self._push_field(
-                ReaderField(
-                    orig_offs,
-                    str(bytes(kv_kdata), encoding="utf-8"),
-                    parts,
-                    [idx + idxs_offs for idx in field_idxs],
-                    field_types,
-                ),
-                skip_sum=True,
-            )
-            offs += field_size
+            data = [idx + idxs_offs for idx in field_idxs]
+        return parts, data
+
+    def _build_fields(self, offs: int, count: int) -> int:
+        for _ in range(count):
+            field, offs = self._build_field(offs)
+            self._push_field(field, skip_sum=True)
         return offs
 
     def _build_tensors_fields(
@@ -282,56 +809,58 @@ class GGUFReader:
 
     def _build_tensors(self, start_offs: int, fields: list[ReaderField]) -> None:
         tensors = []
-        tensor_names = set()  # keep track of name to prevent duplicated tensors
+        tensor_index = {}  # keep track of name to prevent duplicated tensors
         for field in fields:
-            _name_len, name_data, _n_dims, dims, raw_dtype, offset_tensor = field.parts
             # check if there's any tensor having same name already in the list
-            tensor_name = str(bytes(name_data), encoding="utf-8")
-            if tensor_name in tensor_names:
-                raise ValueError(f"Found duplicated tensor with name {tensor_name}")
-            tensor_names.add(tensor_name)
-            ggml_type = GGUFQuantizationType(raw_dtype[0])
-            n_elems = int(np.prod(dims))
-            np_dims = tuple(reversed(dims.tolist()))
-            block_size, type_size = GGUF_QUANT_SIZES[ggml_type]
-            n_bytes = n_elems * type_size // block_size
-            data_offs = int(start_offs + offset_tensor[0])
-            item_type: npt.DTypeLike
-            if ggml_type == GGUFQuantizationType.F16:
-                item_count = n_elems
-                item_type = np.float16
-            elif ggml_type == GGUFQuantizationType.F32:
-                item_count = n_elems
-                item_type = np.float32
-            elif ggml_type == GGUFQuantizationType.F64:
-                item_count = n_elems
-                item_type = np.float64
-            elif ggml_type == GGUFQuantizationType.I8:
-                item_count = n_elems
-                item_type = np.int8
-            elif ggml_type == GGUFQuantizationType.I16:
-                item_count = n_elems
-                item_type = np.int16
-            elif ggml_type == GGUFQuantizationType.I32:
-                item_count = n_elems
-                item_type = np.int32
-            elif ggml_type == GGUFQuantizationType.I64:
-                item_count = n_elems
-                item_type = np.int64
-            else:
-                item_count = n_bytes
-                item_type = np.uint8
-                np_dims = quant_shape_to_byte_shape(np_dims, ggml_type)
-            tensors.append(
-                ReaderTensor(
-                    name=tensor_name,
-                    tensor_type=ggml_type,
-                    shape=dims,
-                    n_elements=n_elems,
-                    n_bytes=n_bytes,
-                    data_offset=data_offs,
-                    data=self._get(data_offs, item_type, item_count).reshape(np_dims),
-                    field=field,
-                )
-            )
+            if field.name in tensor_index:
+                raise ValueError(f"Found duplicated tensor with name {field.name}")
+            tensor_index[field.name] = len(tensors)
+            tensors.append(self._build_tensor(start_offs, field))
         self.tensors = tensors
+        self._tensor_index = tensor_index
+
+    def _build_tensor(self, start_offs: int, field: ReaderField) -> ReaderTensor:
+        _name_len, _name_data, _n_dims, dims, raw_dtype, offset_tensor = field.parts
+        tensor_name = field.name
+        ggml_type = GGUFQuantizationType(raw_dtype[0])
+        n_elems = int(np.prod(dims))
+        np_dims = tuple(reversed(dims.tolist()))
+        block_size, type_size = GGUF_QUANT_SIZES[ggml_type]
+        n_bytes = n_elems * type_size // block_size
+        data_offs = int(start_offs + offset_tensor[0])
+        item_type: npt.DTypeLike
+        if ggml_type == GGUFQuantizationType.F16:
+            item_count = n_elems
+            item_type = np.float16
+        elif ggml_type == GGUFQuantizationType.F32:
+            item_count = n_elems
+            item_type = np.float32
+        elif ggml_type == GGUFQuantizationType.F64:
+            item_count = n_elems
+            item_type = np.float64
+        elif ggml_type == GGUFQuantizationType.I8:
+            item_count = n_elems
+            item_type = np.int8
+        elif ggml_type == GGUFQuantizationType.I16:
+            item_count = n_elems
+            item_type = np.int16
+        elif ggml_type == GGUFQuantizationType.I32:
+            item_count = n_elems
+            item_type = np.int32
+        elif ggml_type == GGUFQuantizationType.I64:
+            item_count = n_elems
+            item_type = np.int64
+        else:
+            item_count = n_bytes
+            item_type = np.uint8
+            np_dims = quant_shape_to_byte_shape(np_dims, ggml_type)
+        return ReaderTensor(
+            name=tensor_name,
+            tensor_type=ggml_type,
+            shape=dims,
+            n_elements=n_elems,
+            n_bytes=n_bytes,
+            data_offset=data_offs,
+            data=self._get(data_offs, item_type, item_count).reshape(np_dims),
+            field=field,
+        )
@@ -214,6 +214,21 @@ class CodepointProcessor:
     def unicode_table(self) -> UnicodeTable:
         return self._unicode_table
 
+    def category_ranges(self, flag: str) -> list[tuple[int, int]]:
+        """
+        Find the inclusive codepoint ranges matched by one of the category regexes.
+
+        Unlike `process_unicode`, which tests every codepoint against every category,
+        this scans all codepoints with a single regex pass and takes well under a second.
+
+        :param flag: A category name such as "is_letter", "is_number" or "is_whitespace".
+
+        :return: A list of (first, last) codepoint ranges in ascending order.
+        """
+        pattern = regex.compile(f"(?:{self._regexes[flag].pattern})+")
+        chars = "".join(map(chr, range(self.MAX_CODEPOINTS)))
+        return [(m.start(), m.end() - 1) for m in pattern.finditer(chars)]
+
     def process_unicode(self):
         for codepoint in range(self.MAX_CODEPOINTS):
             # convert codepoint to unicode character
@@ -0,0 +1,55 @@
+"""
+Module: tok.gpt.cli.vocab
+
+Compile a GPT-2 'encoder.json' and 'vocab.bpe' pair into a memory-mappable 'vocab.bin'
+"""
+
+import argparse
+import json
+import os
+import time
+
+from ..encoder import Encoder
+from ..vocab import compile_vocab
+
+
+def get_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compile 'encoder.json' and 'vocab.bpe' into 'vocab.bin'"
+    )
+    parser.add_argument(
+        "-m", "--model-name", default="124M", help="The GPT-2 model name"
+    )
+    parser.add_argument(
+        "-d", "--models-dir", default="models", help="The GPT-2 models directory"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-path",
+        help="Output file path (default: <models-dir>/<model-name>/vocab.bin)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_arguments()
+    model_path = os.path.join(args.models_dir, args.model_name)
+    output_path = args.output_path or os.path.join(model_path, "vocab.bin")
+
+    with open(os.path.join(model_path, "encoder.json"), "r", encoding="utf-8") as f:
+        encoder = json.load(f)
+
+    with open(os.path.join(model_path, "vocab.bpe"), "r", encoding="utf-8") as f:
+        bpe_data = f.read()
+
+    bpe_merges = [tuple(merge_str.split()) for merge_str in bpe_data.split("\n")[1:-1]]
+    compile_vocab(output_path, encoder, bpe_merges)
+    print(f"Wrote {len(encoder)} tokens and {len(bpe_merges)} merges to {output_path}")
+
+    start = time.perf_counter()
+    Encoder.from_compiled(output_path)
+    print(f"Loaded compiled vocab in {time.perf_counter() - start:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
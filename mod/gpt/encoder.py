@@ -1,8 +1,51 @@
+import codecs
+import heapq
 import json
+import multiprocessing
 import os
-import re
-from functools import lru_cache
-from typing import IO
+from array import array
+from functools import cached_property, lru_cache
+from logging import getLogger
+from typing import IO, Callable, Iterable, Iterator, Literal, Optional, Sequence, Union
+
+import numpy as np
+import regex
+
+from ..cache import BPECache, CacheStats, LRUCache
+from ..detokenizer import IncrementalDecoder
+from .pretokenize import GPT2_PATTERN, PreTokenizer
+from .vocab import CompiledVocab, load_vocab
+
+logger = getLogger(__name__)
+
+# The encoder used by pool workers. It is set in the parent before the pool is
+# forked so the vocab and merge ranks are shared copy-on-write instead of being
+# pickled for every task.
+_worker_encoder: Optional["Encoder"] = None
+
+
+def _init_worker(encoder: Optional["Encoder"]) -> None:
+    global _worker_encoder
+    if encoder is not None:  # spawn start method; pickled once per worker
+        _worker_encoder = encoder
+
+
+def _encode_worker(texts: Sequence[str]) -> list[list[int]]:
+    return [_worker_encoder.encode(text) for text in texts]
+
+
+def _encode_array_worker(texts: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    batch = [_worker_encoder.encode(text) for text in texts]
+    lengths = np.fromiter((len(ids) for ids in batch), dtype=np.int64, count=len(batch))
+    ids = np.fromiter(
+        (idx for ids in batch for idx in ids), dtype=np.uint32, count=int(lengths.sum())
+    )
+    return ids, lengths
+
+
+def _decode_worker(args: tuple[Sequence[Sequence[int]], str]) -> list[str]:
+    batch, errors = args
+    return [_worker_encoder.decode(tokens, errors=errors) for tokens in batch]
 
 
 class Encoder:
@@ -10,30 +53,170 @@ class Encoder:
         self,
         encoder: IO,
         bpe_merges: set[tuple[str, str]],
+        merge_engine: Literal["scan", "heap"] = "scan",
+        cache: Optional[BPECache] = None,
+        pretokenizer: Optional[PreTokenizer] = None,
     ):
+        self._init_engine(merge_engine, cache, pretokenizer)
         self.encoder = encoder
         self.bpe_ranks = dict(zip(bpe_merges, range(len(bpe_merges))))
-        self.cache = {}
+        self._decoder = {v: k for k, v in self.encoder.items()}
+        # reverse id -> bytes array; None for ids missing from the vocab
+        self._token_bytes: list[Optional[bytes]] = [None] * (
+            max(self._decoder, default=-1) + 1
+        )
+        for idx, token in self._decoder.items():
+            self._token_bytes[idx] = bytes(self._byte_decoder[c] for c in token)
 
-        # Should have added re.IGNORECASE so BPE merges can happen for capitalized versions of contractions
-        self.pattern = re.compile(
-            r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+        self._compile_merges(bpe_merges)
+
+    def _init_engine(
+        self,
+        merge_engine: Literal["scan", "heap"],
+        cache: Optional[BPECache],
+        pretokenizer: Optional[PreTokenizer],
+    ) -> None:
+        # Bounded by default; long running workers see an unbounded number of pre-tokens
+        self.cache = cache if cache is not None else LRUCache()
+
+        # Lookup tables are compiled once; the encoder is not expected to change.
+        self._byte_encoder = Encoder.bytes_to_unicode()
+        self._byte_decoder = {v: k for k, v in self._byte_encoder.items()}
+        # str.translate table mapping latin-1 decoded bytes to visible symbols
+        self._byte_table = str.maketrans(
+            {chr(b): c for b, c in self._byte_encoder.items()}
         )
 
+        # "scan" is the reference implementation, "heap" produces the same
+        # merges in O(n log n) over symbol ids and is preferable in production.
+        if merge_engine == "scan":
+            self.merge = self.bpe
+        elif merge_engine == "heap":
+            self.merge = self.bpe_heap
+        else:
+            raise ValueError(f"Unknown merge engine: {merge_engine}")
+        self.merge_engine = merge_engine
+
+        # Should have added re.IGNORECASE so BPE merges can happen for capitalized versions of contractions
+        # NOTE: The stdlib re module does not support \p{L} and \p{N}.
+        self.pattern = regex.compile(GPT2_PATTERN)
+        # Splits text into the same pieces as self.pattern, only faster
+        self.pretokenizer = pretokenizer or PreTokenizer.default()
+
     @staticmethod
-    def get_encoder(model_name: str, models_dir: str) -> "Encoder":
+    def get_encoder(
+        model_name: str,
+        models_dir: str,
+        merge_engine: Literal["scan", "heap"] = "scan",
+    ) -> "Encoder":
         json_encoder_path = os.path.join(models_dir, model_name, "encoder.json")
+        bpe_vocab_path = os.path.join(models_dir, model_name, "vocab.bpe")
+
+        # Prefer the compiled vocab produced by `python -m mod.gpt.cli.vocab`,
+        # unless a source file was modified after it was compiled
+        compiled_path = os.path.join(models_dir, model_name, "vocab.bin")
+        if os.path.isfile(compiled_path):
+            compiled_mtime = os.stat(compiled_path).st_mtime_ns
+            stale = [
+                path
+                for path in (json_encoder_path, bpe_vocab_path)
+                if os.path.isfile(path) and os.stat(path).st_mtime_ns > compiled_mtime
+            ]
+            if not stale:
+                return Encoder.from_compiled(compiled_path, merge_engine)
+            logger.warning(
+                f"Ignoring {compiled_path}, it is older than {', '.join(stale)}"
+            )
+
         with open(json_encoder_path, "r", encoding="utf-8") as f:
             encoder = json.load(f)
-
-        bpe_vocab_path = os.path.join(models_dir, model_name, "vocab.bpe")
         with open(bpe_vocab_path, "r", encoding="utf-8") as f:
             bpe_data = f.read()
 
         bpe_merges = [
             tuple(merge_str.split()) for merge_str in bpe_data.split("\n")[1:-1]
         ]
-        return Encoder(encoder, bpe_merges)
+        return Encoder(encoder, bpe_merges, merge_engine)
+
+    @staticmethod
+    def from_compiled(
+        path: str,
+        merge_engine: Literal["scan", "heap"] = "scan",
+        cache: Optional[BPECache] = None,
+        pretokenizer: Optional[PreTokenizer] = None,
+    ) -> "Encoder":
+        """
+        Load an encoder from a compiled vocab file.
+
+        The merge and decode tables of the "heap" engine are built straight from the
+        id arrays of the file. The vocab strings and `bpe_ranks`, which only the
+        "scan" engine needs, are decoded on first use.
+
+        :param path: The compiled vocab file path.
+        :param merge_engine: The merge engine, as for `Encoder`.
+        :param cache: The merge cache, as for `Encoder`.
+        :param pretokenizer: The pre-tokenizer, as for `Encoder`.
+
+        :return: An encoder producing the same ids as the source vocab.
+        """
+        vocab = load_vocab(path)
+        encoder = Encoder.__new__(Encoder)
+        encoder._init_engine(merge_engine, cache, pretokenizer)
+        if not encoder._load_compiled(vocab):
+            # Some byte symbol is not in the vocab; number it like _compile_merges
+            return Encoder(
+                vocab.encoder(), vocab.bpe_merges(), merge_engine, cache, pretokenizer
+            )
+        return encoder
+
+    def _load_compiled(self, vocab: CompiledVocab) -> bool:
+        data, bounds = vocab.decode_symbols(self._byte_decoder)
+        # ids of the single byte strings, by byte value
+        singles = np.flatnonzero(np.diff(bounds) == 1)
+        byte_values = np.frombuffer(data, dtype=np.uint8)[bounds[singles]]
+        byte_ids = dict(zip(byte_values.tolist(), vocab.ids[singles].tolist()))
+        if len(byte_ids) < 256:
+            return False
+
+        self._vocab = vocab
+        ids = vocab.ids.tolist()
+        bounds = bounds.tolist()
+        token_bytes = [data[start:end] for start, end in zip(bounds, bounds[1:])]
+        # compile_vocab writes the strings in id order
+        if ids == list(range(len(ids))):
+            self._token_bytes = token_bytes
+        else:
+            self._token_bytes = [None] * (max(ids, default=-1) + 1)
+            for idx, token in zip(ids, token_bytes):
+                self._token_bytes[idx] = token
+        self._byte_ids = [byte_ids[b] for b in range(256)]
+        # Every merged symbol is in the vocab, see compile_vocab
+        self._merges = vocab.merge_table()
+        return True
+
+    # The tables below are set by __init__; encoders loaded with from_compiled
+    # decode them from the vocab file on first use.
+
+    @cached_property
+    def encoder(self) -> dict[str, int]:
+        return self._vocab.encoder()
+
+    @cached_property
+    def bpe_ranks(self) -> dict[tuple[str, str], int]:
+        bpe_merges = self._vocab.bpe_merges()
+        return dict(zip(bpe_merges, range(len(bpe_merges))))
+
+    @cached_property
+    def _decoder(self) -> dict[int, str]:
+        return {v: k for k, v in self.encoder.items()}
+
+    @cached_property
+    def _symbol_ids(self) -> dict[str, int]:
+        return dict(self.encoder)
+
+    @cached_property
+    def _symbols(self) -> dict[int, str]:
+        return dict(self._decoder)
 
     @lru_cache()
     @staticmethod
@@ -75,21 +258,49 @@ class Encoder:
             prev_char = char
         return pairs
 
+    @property
+    def cache_stats(self) -> CacheStats:
+        return self.cache.stats
+
     @property
     def byte_encoder(self) -> dict[int, str]:
-        return Encoder.bytes_to_unicode()
+        return self._byte_encoder
 
     @property
     def byte_decoder(self) -> dict[str, int]:
-        return {v: k for k, v in self.byte_encoder.items()}
+        return self._byte_decoder
 
     @property
     def decoder(self) -> dict:
-        return {v: k for k, v in self.encoder.items()}
+        return self._decoder
+
+    def token_bytes(self, token: int) -> bytes:
+        """
+        Look up the raw bytes of a single token id.
+
+        :param token: A token id from the encoder.
+
+        :return: The UTF-8 byte sequence, possibly incomplete, represented by the token.
+        """
+        data = self._token_bytes[token] if 0 <= token < len(self._token_bytes) else None
+        if data is None:
+            raise KeyError(token)
+        return data
+
+    def byte_encode(self, text: str) -> str:
+        """
+        Map the UTF-8 bytes of a text to the visible unicode symbols used by the merges.
+
+        :param text: A pre-token or any other string.
+
+        :return: A string with one symbol per byte of the input.
+        """
+        return text.encode("utf-8").decode("latin-1").translate(self._byte_table)
 
     def bpe(self, token):
-        if token in self.cache:
-            return self.cache[token]
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
         word = tuple(token)
         pairs = Encoder.get_pairs(word)
 
@@ -128,18 +339,308 @@ class Encoder:
         self.cache[token] = word
         return word
 
+    def _compile_merges(self, bpe_merges: Sequence[tuple[str, str]]) -> None:
+        # Every symbol gets an int id; symbols missing from the vocab (which only
+        # appear as intermediate merges in a malformed vocab) are numbered after it.
+        self._symbol_ids: dict[str, int] = dict(self.encoder)
+        self._symbols: dict[int, str] = dict(self._decoder)
+        next_id = max(self._symbols, default=-1) + 1
+
+        def symbol_id(symbol: str) -> int:
+            nonlocal next_id
+            idx = self._symbol_ids.get(symbol)
+            if idx is None:
+                idx = self._symbol_ids[symbol] = next_id
+                self._symbols[idx] = symbol
+                next_id += 1
+            return idx
+
+        self._byte_ids = [symbol_id(self._byte_encoder[b]) for b in range(256)]
+        # (left id << 32 | right id) -> (rank, merged id); a repeated pair keeps
+        # its last rank just like bpe_ranks does.
+        self._merges: dict[int, tuple[int, int]] = {}
+        for rank, (first, second) in enumerate(bpe_merges):
+            key = symbol_id(first) << 32 | symbol_id(second)
+            self._merges[key] = (rank, symbol_id(first + second))
+
+    def _merge_ids(self, symbols: list[int]) -> list[int]:
+        """
+        Merge a sequence of symbol ids with a rank-keyed heap over an index-linked array.
+
+        Each symbol keeps the index of its left and right neighbour, so a merge only
+        touches the two pairs adjacent to it instead of rebuilding the word. All
+        candidates sharing the lowest rank are applied left to right before any newly
+        created pair is considered, which yields exactly the same merges as `bpe`.
+
+        :param symbols: The symbol ids of a pre-token; modified in place.
+
+        :return: The merged symbol ids.
+        """
+        if len(symbols) < 2:
+            return symbols
+
+        merges = self._merges
+        prev = list(range(-1, len(symbols) - 1))
+        next = list(range(1, len(symbols) + 1))
+        next[-1] = -1
+
+        heap = []
+        for i in range(len(symbols) - 1):
+            merge = merges.get(symbols[i] << 32 | symbols[i + 1])
+            if merge is not None:
+                heap.append((merge[0], i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank = heap[0][0]
+            # candidates with the same rank pop in left to right order
+            batch = []
+            while heap and heap[0][0] == rank:
+                batch.append(heapq.heappop(heap)[1])
+
+            for i in batch:
+                j = next[i]
+                # skip stale candidates invalidated by an earlier merge
+                if symbols[i] == -1 or j == -1:
+                    continue
+                merge = merges.get(symbols[i] << 32 | symbols[j])
+                if merge is None or merge[0] != rank:
+                    continue
+
+                symbols[i] = merge[1]
+                symbols[j] = -1
+                k = next[i] = next[j]
+                if k != -1:
+                    prev[k] = i
+                    merge = merges.get(symbols[i] << 32 | symbols[k])
+                    if merge is not None:
+                        heapq.heappush(heap, (merge[0], i))
+                if prev[i] != -1:
+                    merge = merges.get(symbols[prev[i]] << 32 | symbols[i])
+                    if merge is not None:
+                        heapq.heappush(heap, (merge[0], prev[i]))
+
+        word = []
+        i = 0
+        while i != -1:
+            word.append(symbols[i])
+            i = next[i]
+        return word
+
+    def bpe_heap(self, token: str) -> str:
+        """
+        Merge the symbols of a token with the integer heap engine.
+
+        :param token: A pre-token already mapped through the byte encoder.
+
+        :return: The merged symbols of the token separated by spaces, as `bpe` does.
+        """
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
+        if len(token) < 2:
+            return token
+
+        symbols = self._merge_ids([self._symbol_ids[c] for c in token])
+        word = " ".join(self._symbols[idx] for idx in symbols)
+        self.cache[token] = word
+        return word
+
+    def bpe_ids(self, token: bytes) -> tuple[int, ...]:
+        """
+        Merge the UTF-8 bytes of a pre-token directly into token ids.
+
+        :param token: The UTF-8 encoded pre-token.
+
+        :return: The token ids of the pre-token.
+
+        :raises KeyError: If a merged symbol is not part of the vocab.
+        """
+        # bytes keys never collide with the str keys used by bpe and bpe_heap
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
+
+        ids = tuple(self._merge_ids([self._byte_ids[b] for b in token]))
+        for idx in ids:
+            if idx >= len(self._token_bytes) or self._token_bytes[idx] is None:
+                raise KeyError(self._symbols[idx])
+        self.cache[token] = ids
+        return ids
+
     def encode(self, text: str) -> list[int]:
+        return self._encode_pretokens(self.pretokenizer.findall(text))
+
+    def _encode_pretokens(self, pretokens: Iterable[str]) -> list[int]:
         bpe_tokens = []
-        for token in re.findall(self.pattern, text):
-            token = "".join(self.byte_encoder[b] for b in token.encode("utf-8"))
+        if self.merge_engine == "heap":
+            for token in pretokens:
+                bpe_tokens.extend(self.bpe_ids(token.encode("utf-8")))
+            return bpe_tokens
+
+        for token in pretokens:
+            token = self.byte_encode(token)
             bpe_tokens.extend(
-                self.encoder[bpe_token] for bpe_token in self.bpe(token).split(" ")
+                self.encoder[bpe_token] for bpe_token in self.merge(token).split(" ")
             )
         return bpe_tokens
 
+    def encode_stream(
+        self,
+        fileobj: IO,
+        chunk_size: int = 1 << 20,
+        as_array: bool = False,
+    ) -> Iterator[Union[list[int], array]]:
+        """
+        Encode a text or binary file-like object chunk by chunk.
+
+        Memory stays bounded by `chunk_size` plus the longest pre-token, regardless of
+        the size of the input. Binary inputs are decoded as UTF-8 incrementally.
+
+        :param fileobj: An object with a `read(size)` method returning str or bytes.
+        :param chunk_size: Number of characters or bytes to read at a time.
+        :param as_array: Yield `array("I")` buffers instead of lists.
+
+        :return: An iterator of token id batches which concatenate to `encode(text)`.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        while True:
+            raw = fileobj.read(chunk_size)
+            # raises UnicodeDecodeError on a truncated trailing sequence
+            chunk = (
+                decoder.decode(raw, final=not raw) if isinstance(raw, bytes) else raw
+            )
+            if not raw:
+                break
+            buffer += chunk
+
+            pretokens = self.pretokenizer.findall(buffer)
+            # The last two pre-tokens may still change when more text arrives,
+            # e.g. "'" + "l" becomes "'ll" and trailing spaces hand one space to
+            # the next word, so they are carried over to the next chunk.
+            if len(pretokens) <= 2:
+                continue
+            # pre-tokens always cover the whole buffer
+            buffer = pretokens[-2] + pretokens[-1]
+            ids = self._encode_pretokens(pretokens[:-2])
+            yield array("I", ids) if as_array else ids
+
+        ids = self._encode_pretokens(self.pretokenizer.findall(buffer))
+        if ids:
+            yield array("I", ids) if as_array else ids
+
     def decode(self, tokens: list[int], errors: str = "replace") -> str:
-        text = "".join([self.decoder[token] for token in tokens])
-        text = bytearray([self.byte_decoder[c] for c in text]).decode(
+        text = b"".join([self.token_bytes(token) for token in tokens]).decode(
             "utf-8", errors=errors  # handle decoding errors
         )
         return text
+
+    def incremental_decoder(self, errors: str = "replace") -> IncrementalDecoder:
+        """
+        Create a decoder which accepts token ids one at a time during generation.
+
+        :param errors: How to handle invalid UTF-8 sequences.
+
+        :return: An `IncrementalDecoder` whose `push(token)` returns only new text.
+        """
+        return IncrementalDecoder(self.token_bytes, errors=errors)
+
+    def _map(
+        self,
+        worker: Callable,
+        tasks: list,
+        num_workers: Optional[int],
+    ) -> list:
+        global _worker_encoder
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = min(num_workers, len(tasks))
+
+        if num_workers <= 1:
+            _worker_encoder, previous = self, _worker_encoder
+            try:
+                return [worker(task) for task in tasks]
+            finally:
+                _worker_encoder = previous
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            initargs = (None,)
+        else:
+            context = multiprocessing.get_context()
+            initargs = (self,)
+
+        _worker_encoder, previous = self, _worker_encoder
+        try:
+            with context.Pool(num_workers, _init_worker, initargs) as pool:
+                return pool.map(worker, tasks)
+        finally:
+            _worker_encoder = previous
+
+    def encode_batch(
+        self,
+        texts: Sequence[str],
+        num_workers: Optional[int] = None,
+        batch_size: int = 64,
+        return_array: bool = False,
+    ) -> Union[list[list[int]], tuple[np.ndarray, np.ndarray]]:
+        """
+        Encode many texts across a pool of worker processes.
+
+        :param texts: The texts to encode.
+        :param num_workers: Number of worker processes (default: os.cpu_count()).
+            Values <= 1 encode in the calling process.
+        :param batch_size: Number of texts sent to a worker per task.
+        :param return_array: Return a flat id array and offsets instead of lists.
+
+        :return: A list of token ids per text in input order, or a tuple of a flat
+            `np.uint32` id array and an `np.int64` offsets array of length
+            `len(texts) + 1` such that `ids[offsets[i]:offsets[i + 1]]` are the
+            ids of `texts[i]`.
+        """
+        tasks = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+        if not return_array:
+            results = self._map(_encode_worker, tasks, num_workers)
+            return [ids for batch in results for ids in batch]
+
+        results = self._map(_encode_array_worker, tasks, num_workers)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        if results:
+            np.cumsum(
+                np.concatenate([lengths for _, lengths in results]), out=offsets[1:]
+            )
+        ids = np.concatenate([ids for ids, _ in results] or [np.empty(0, np.uint32)])
+        return ids, offsets
+
+    def decode_batch(
+        self,
+        tokens: Union[Sequence[Sequence[int]], np.ndarray],
+        offsets: Optional[np.ndarray] = None,
+        num_workers: Optional[int] = None,
+        batch_size: int = 64,
+        errors: str = "replace",
+    ) -> list[str]:
+        """
+        Decode many token id sequences across a pool of worker processes.
+
+        :param tokens: A sequence of token id sequences, or a flat id array when
+            `offsets` is given (as returned by `encode_batch(..., return_array=True)`).
+        :param offsets: Offsets into a flat `tokens` array.
+        :param num_workers: Number of worker processes (default: os.cpu_count()).
+        :param batch_size: Number of sequences sent to a worker per task.
+        :param errors: How to handle incomplete or invalid UTF-8 sequences.
+
+        :return: The decoded texts in input order.
+        """
+        if offsets is not None:
+            tokens = [
+                tokens[offsets[i] : offsets[i + 1]].tolist()
+                for i in range(len(offsets) - 1)
+            ]
+        tasks = [
+            (tokens[i : i + batch_size], errors)
+            for i in range(0, len(tokens), batch_size)
+        ]
+        results = self._map(_decode_worker, tasks, num_workers)
+        return [text for batch in results for text in batch]
@@ -0,0 +1,126 @@
+"""
+Module: tok.gpt.pretokenize
+
+A pre-tokenizer which splits text into the same pieces as the GPT-2 pattern without
+matching unicode properties at runtime.
+
+Every codepoint is classified once into a letter (\\p{L}), number (\\p{N}), whitespace
+(\\s) or other table. At split time ASCII characters are kept as they are and every
+other codepoint is replaced by a placeholder for its class, so the GPT-2 pattern can be
+expressed with small ASCII character sets and run by the stdlib re module.
+"""
+
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import regex
+
+if TYPE_CHECKING:
+    from ..gguf.unicode import CodepointProcessor
+
+# The reference pattern; it requires the regex module for \p{L} and \p{N}
+GPT2_PATTERN = (
+    r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+)
+
+MAX_CODEPOINTS = 0x110000
+
+# Codepoint classes; non-ASCII codepoints are replaced by chr(0x80 + class)
+LETTER = 0
+NUMBER = 1
+WHITESPACE = 2
+OTHER = 3
+
+CATEGORY_FLAGS = {
+    LETTER: ("is_letter", r"\p{L}"),
+    NUMBER: ("is_number", r"\p{N}"),
+    WHITESPACE: ("is_whitespace", r"\s"),
+}
+
+
+def get_codepoint_classes(
+    processor: Optional["CodepointProcessor"] = None,
+) -> np.ndarray:
+    """
+    Build the codepoint class table.
+
+    :param processor: A `tok.gguf.unicode.CodepointProcessor` providing the category
+        ranges. Without one, the ranges are computed with the same regexes directly,
+        which avoids importing the gguf package.
+
+    :return: A uint8 array of length 0x110000 mapping each codepoint to its class.
+    """
+    classes = np.full(MAX_CODEPOINTS, OTHER, dtype=np.uint8)
+    chars = None
+    for cls, (flag, pattern) in CATEGORY_FLAGS.items():
+        if processor is not None:
+            ranges = processor.category_ranges(flag)
+        else:
+            chars = chars or "".join(map(chr, range(MAX_CODEPOINTS)))
+            ranges = [
+                (m.start(), m.end() - 1)
+                for m in regex.finditer(f"(?:{pattern})+", chars)
+            ]
+        for first, last in ranges:
+            classes[first : last + 1] = cls
+    return classes
+
+
+class PreTokenizer:
+    """
+    Split text into GPT-2 pre-tokens using a precomputed codepoint class table.
+
+    :param classes: The table returned by `get_codepoint_classes`.
+    """
+
+    def __init__(self, classes: np.ndarray):
+        if len(classes) != MAX_CODEPOINTS:
+            raise ValueError(f"Expected {MAX_CODEPOINTS} codepoint classes")
+        self.classes = classes
+        # ASCII codepoints map to themselves, everything else to its placeholder
+        self._placeholders = classes.astype(np.uint32) + 0x80
+        self._placeholders[:0x80] = np.arange(0x80)
+        self._placeholders = self._placeholders.astype(np.uint8)
+
+        def charset(cls: int) -> str:
+            ascii = np.flatnonzero(classes[:0x80] == cls)
+            return "".join(re.escape(chr(c)) for c in ascii) + re.escape(
+                chr(0x80 + cls)
+            )
+
+        L, N, S = charset(LETTER), charset(NUMBER), charset(WHITESPACE)
+        self.pattern = re.compile(
+            rf"""'s|'t|'re|'ve|'m|'ll|'d| ?[{L}]+| ?[{N}]+| ?[^{S}{L}{N}]+|[{S}]+(?![^{S}])|[{S}]+"""
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def default() -> "PreTokenizer":
+        """A process-wide pre-tokenizer; building the class table takes a fraction of a second."""
+        return PreTokenizer(get_codepoint_classes())
+
+    def findall(self, text: str) -> list[str]:
+        """
+        Split a text into pre-tokens.
+
+        :param text: The text to split.
+
+        :return: The same list of strings as `regex.findall(GPT2_PATTERN, text)`.
+        """
+        if text.isascii():
+            return self.pattern.findall(text)
+
+        codepoints = np.frombuffer(
+            text.encode("utf-32-le", errors="surrogatepass"), dtype="<u4"
+        )
+        # one placeholder char per codepoint keeps positions aligned with text
+        placeholders = self._placeholders[codepoints].tobytes().decode("latin-1")
+        tokens = []
+        start = 0
+        for token in self.pattern.findall(placeholders):
+            end = start + len(token)
+            tokens.append(text[start:end])
+            start = end
+        return tokens
@@ -0,0 +1,200 @@
+"""
+Module: tok.gpt.vocab
+
+A compiled, memory-mappable representation of a GPT-2 `encoder.json` and
+`vocab.bpe` pair.
+
+Layout (little-endian, every section aligned to 8 bytes):
+
+    header    magic "GPTV", uint32 version, uint32 n_vocab, uint32 n_merges,
+              uint64 blob size
+    ids       uint32[n_vocab]         token id of each vocab string
+    offsets   uint64[n_vocab + 1]     offsets of each vocab string in the blob
+    merges    uint32[n_merges, 3]     (left id, right id, merged id) by rank
+    blob      uint8[blob size]        concatenated UTF-8 vocab strings
+"""
+
+import mmap
+import os
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+
+VOCAB_MAGIC = b"GPTV"
+VOCAB_VERSION = 1
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        ("n_vocab", "<u4"),
+        ("n_merges", "<u4"),
+        ("blob_size", "<u8"),
+    ]
+)
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return offset + (-offset % alignment)
+
+
+@dataclass
+class CompiledVocab:
+    # Views into the mapped file; pages are shared by every process mapping it.
+    ids: np.ndarray
+    offsets: np.ndarray
+    merges: np.ndarray
+    blob: np.ndarray
+
+    @property
+    def n_vocab(self) -> int:
+        return len(self.ids)
+
+    @property
+    def n_merges(self) -> int:
+        return len(self.merges)
+
+    def tokens(self) -> list[str]:
+        """Decode the vocab strings in file order."""
+        text = self.blob.tobytes()
+        bounds = self.offsets.tolist()
+        return [
+            text[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])
+        ]
+
+    def encoder(self) -> dict[str, int]:
+        return dict(zip(self.tokens(), self.ids.tolist()))
+
+    def bpe_merges(self) -> list[tuple[str, str]]:
+        tokens = dict(zip(self.ids.tolist(), self.tokens()))
+        return [
+            (tokens[left], tokens[right]) for left, right, _ in self.merges.tolist()
+        ]
+
+    def merge_table(self) -> dict[int, tuple[int, int]]:
+        """
+        Map each merge's (left id << 32 | right id) to its (rank, merged id).
+
+        A repeated pair keeps its last rank, like a dict of the decoded merges.
+        """
+        left, right, merged = self.merges.astype(np.uint64).T
+        keys = (left << np.uint64(32) | right).tolist()
+        return dict(zip(keys, zip(range(self.n_merges), merged.tolist())))
+
+    def decode_symbols(self, byte_decoder: dict[str, int]) -> tuple[bytes, np.ndarray]:
+        """
+        Decode the vocab strings to raw bytes in bulk.
+
+        :param byte_decoder: The mapping of byte-level symbols to byte values.
+
+        :return: The concatenated raw bytes and the offsets of each string in them.
+
+        :raises KeyError: If a vocab string contains a character which is not a symbol.
+        """
+        blob = self.blob
+        if (blob >= 0xE0).any():
+            # Symbols are all below U+0800, so only 1 and 2 byte sequences are valid
+            text = blob.tobytes().decode("utf-8")
+            raise KeyError(min(set(text).difference(byte_decoder)))
+        lead = (blob & 0xC0) != 0x80
+        starts = np.flatnonzero(lead)
+        points = blob[starts].astype(np.int32)
+        pairs = points >= 0xC0
+        points[pairs] = (points[pairs] & 0x1F) << 6 | (blob[starts[pairs] + 1] & 0x3F)
+
+        table = np.full(0x800, -1, dtype=np.int16)
+        for symbol, byte in byte_decoder.items():
+            if ord(symbol) < len(table):
+                table[ord(symbol)] = byte
+        values = table[points]
+        if (values < 0).any():
+            raise KeyError(chr(points[np.argmax(values < 0)]))
+        data = values.astype(np.uint8).tobytes()
+
+        # Each symbol becomes one byte, so a string starts at the number of
+        # symbols before it
+        n_symbols = np.zeros(len(blob) + 1, dtype=np.int64)
+        np.cumsum(lead, out=n_symbols[1:])
+        return data, n_symbols[self.offsets.astype(np.int64)]
+
+
+def compile_vocab(
+    path: Union[str, os.PathLike],
+    encoder: dict[str, int],
+    bpe_merges: list[tuple[str, str]],
+) -> None:
+    """
+    Write an encoder and its merges to a compiled vocab file.
+
+    :param path: The output file path.
+    :param encoder: The mapping of vocab strings to token ids.
+    :param bpe_merges: The merges in rank order.
+
+    :raises ValueError: If a merge refers to a symbol missing from the encoder.
+    """
+    tokens = sorted(encoder, key=encoder.get)
+    ids = np.array([encoder[token] for token in tokens], dtype="<u4")
+    data = [token.encode("utf-8") for token in tokens]
+    offsets = np.zeros(len(data) + 1, dtype="<u8")
+    np.cumsum([len(token) for token in data], out=offsets[1:])
+
+    merges = np.empty((len(bpe_merges), 3), dtype="<u4")
+    for rank, (first, second) in enumerate(bpe_merges):
+        try:
+            merges[rank] = encoder[first], encoder[second], encoder[first + second]
+        except KeyError as e:
+            raise ValueError(f"Merge {rank} refers to unknown symbol {e}") from e
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (VOCAB_MAGIC, VOCAB_VERSION, len(ids), len(merges), offsets[-1])
+
+    with open(path, "wb") as f:
+        for section in (header, ids, offsets, merges):
+            f.write(section.tobytes())
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        f.write(b"".join(data))
+
+
+def load_vocab(path: Union[str, os.PathLike]) -> CompiledVocab:
+    """
+    Map a compiled vocab file into memory without copying or parsing it.
+
+    :param path: The compiled vocab file path.
+
+    :return: Read-only array views into the mapped file.
+
+    :raises ValueError: If the file is not a compiled vocab of a supported version.
+    """
+    with open(path, "rb") as f:
+        # The mapping stays valid after the file is closed
+        data = np.frombuffer(
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), np.uint8
+        )
+
+    if len(data) < HEADER_DTYPE.itemsize:
+        raise ValueError("Compiled vocab is truncated")
+    header = data[: HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header["magic"] != VOCAB_MAGIC:
+        raise ValueError("Compiled vocab magic invalid")
+    if header["version"] != VOCAB_VERSION:
+        raise ValueError(f"Compiled vocab version {header['version']} is not supported")
+
+    n_vocab = int(header["n_vocab"])
+    n_merges = int(header["n_merges"])
+    offs = _align(HEADER_DTYPE.itemsize)
+
+    def take(dtype: str, count: int) -> np.ndarray:
+        nonlocal offs
+        size = np.dtype(dtype).itemsize * count
+        if offs + size > len(data):
+            raise ValueError("Compiled vocab is truncated")
+        section = data[offs : offs + size].view(dtype)
+        offs = _align(offs + size)
+        return section
+
+    ids = take("<u4", n_vocab)
+    offsets = take("<u8", n_vocab + 1)
+    merges = take("<u4", 3 * n_merges).reshape(n_merges, 3)
+    blob = take("u1", int(header["blob_size"]))
+    return CompiledVocab(ids, offsets, merges, blob)
@@ -0,0 +1,405 @@
+"""
+Module: tok.llama.bpe
+
+A pure Python byte-pair encoding backend compatible with tiktoken.
+
+Loads tiktoken rank files and encodes text to the same token IDs as
+`tiktoken.Encoding`, for hosts where the tiktoken wheel cannot be installed.
+
+Decoded ranks can be cached in a binary sidecar next to the rank file, so they
+are not base64 decoded again by every process. Sidecar layout (little-endian,
+every section aligned to 8 bytes):
+
+    header    magic "LBPE", uint32 version, uint64 n_tokens, uint64 blob size,
+              uint64 source size, int64 source mtime (ns), uint8[16] source digest
+    ranks     uint32[n_tokens]        rank of each token
+    offsets   uint64[n_tokens + 1]    offsets of each token in the blob
+    blob      uint8[blob size]        concatenated token bytes
+"""
+
+import base64
+import hashlib
+import heapq
+import mmap
+import os
+from logging import getLogger
+from typing import AbstractSet, Collection, Dict, List, Literal, Optional, Union
+
+import numpy as np
+import regex
+
+from ..cache import BPECache, LRUCache
+
+logger = getLogger(__name__)
+
+RANKS_MAGIC = b"LBPE"
+RANKS_VERSION = 1
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        ("n_tokens", "<u8"),
+        ("blob_size", "<u8"),
+        ("source_size", "<u8"),
+        ("source_mtime_ns", "<i8"),
+        ("source_digest", "u1", (16,)),
+    ]
+)
+
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return offset + (-offset % alignment)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _parse_bpe(data: bytes) -> Dict[bytes, int]:
+    return {
+        base64.b64decode(token): int(rank)
+        for token, rank in (line.split() for line in data.splitlines() if line)
+    }
+
+
+def load_bpe(path: str) -> Dict[bytes, int]:
+    """
+    Loads a tiktoken rank file, one base64 encoded token and its rank per line.
+
+    :param path: The path to the rank file, e.g. tokenizers/bpe/tokenizer.model.
+    :return: A mapping of token bytes to ranks.
+    """
+    with open(path, "rb") as file:
+        return _parse_bpe(file.read())
+
+
+def save_ranks(
+    path: str, mergeable_ranks: Dict[bytes, int], source: os.stat_result, digest: bytes
+) -> None:
+    """
+    Writes decoded ranks to a sidecar file, replacing it atomically.
+
+    :param path: The sidecar file path.
+    :param mergeable_ranks: A mapping of token bytes to ranks.
+    :param source: The stat of the rank file the ranks were decoded from.
+    :param digest: The 16 byte BLAKE2b digest of the rank file.
+    """
+    tokens = sorted(mergeable_ranks, key=mergeable_ranks.get)
+    ranks = np.array([mergeable_ranks[token] for token in tokens], dtype="<u4")
+    offsets = np.zeros(len(tokens) + 1, dtype="<u8")
+    np.cumsum([len(token) for token in tokens], out=offsets[1:])
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (
+        RANKS_MAGIC,
+        RANKS_VERSION,
+        len(tokens),
+        offsets[-1],
+        source.st_size,
+        source.st_mtime_ns,
+        np.frombuffer(digest, dtype=np.uint8),
+    )
+
+    # Concurrent writers each rename a complete file into place
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for section in (header, ranks, offsets):
+                f.write(section.tobytes())
+                f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(b"".join(tokens))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_ranks(path: str, source_path: str) -> Optional[Dict[bytes, int]]:
+    """
+    Loads decoded ranks from a sidecar file if it matches the rank file.
+
+    The sidecar matches when the size and modification time of the rank file are
+    unchanged, or else when the digest of its contents is unchanged, in which case
+    the new size and modification time are stored in the sidecar.
+
+    :param path: The sidecar file path.
+    :param source_path: The path to the rank file.
+    :return: A mapping of token bytes to ranks, or None if the sidecar is missing,
+        invalid or stale.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = np.frombuffer(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), np.uint8
+            )
+    except (OSError, ValueError):  # missing or empty
+        return None
+
+    if len(data) < HEADER_DTYPE.itemsize:
+        return None
+    header = data[: HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header["magic"] != RANKS_MAGIC or header["version"] != RANKS_VERSION:
+        return None
+
+    source = os.stat(source_path)
+    if (
+        header["source_size"] != source.st_size
+        or header["source_mtime_ns"] != source.st_mtime_ns
+    ):
+        with open(source_path, "rb") as f:
+            if _digest(f.read()) != header["source_digest"].tobytes():
+                return None
+        # Same contents, e.g. after a copy or touch: store the new stat so the next
+        # load skips the digest again
+        header = header.copy()
+        header["source_size"] = source.st_size
+        header["source_mtime_ns"] = source.st_mtime_ns
+        try:
+            with open(path, "r+b") as f:
+                f.write(header.tobytes())
+        except OSError:  # e.g. a read-only filesystem
+            pass
+
+    n_tokens = int(header["n_tokens"])
+    ranks_start = _align(HEADER_DTYPE.itemsize)
+    offsets_start = _align(ranks_start + 4 * n_tokens)
+    blob_start = _align(offsets_start + 8 * (n_tokens + 1))
+    if blob_start + int(header["blob_size"]) > len(data):
+        return None
+    ranks = data[ranks_start : ranks_start + 4 * n_tokens].view("<u4").tolist()
+    bounds = data[offsets_start:blob_start].view("<u8")[: n_tokens + 1].tolist()
+    blob = data[blob_start : blob_start + int(header["blob_size"])].tobytes()
+    tokens = [blob[start:end] for start, end in zip(bounds, bounds[1:])]
+    return dict(zip(tokens, ranks))
+
+
+def load_bpe_cached(path: str, cache_path: Optional[str] = None) -> Dict[bytes, int]:
+    """
+    Loads a tiktoken rank file through a binary sidecar of its decoded ranks.
+
+    The sidecar is written on first use and rewritten whenever the rank file changes.
+    If it cannot be written, e.g. on a read-only filesystem, the ranks are still
+    returned.
+
+    :param path: The path to the rank file, e.g. tokenizers/bpe/tokenizer.model.
+    :param cache_path: The sidecar file path, `<path>.ranks` by default.
+    :return: A mapping of token bytes to ranks.
+    """
+    cache_path = cache_path or f"{path}.ranks"
+    mergeable_ranks = load_ranks(cache_path, path)
+    if mergeable_ranks is not None:
+        return mergeable_ranks
+
+    with open(path, "rb") as file:
+        source = os.fstat(file.fileno())
+        data = file.read()
+    mergeable_ranks = _parse_bpe(data)
+    try:
+        save_ranks(cache_path, mergeable_ranks, source, _digest(data))
+    except OSError as e:
+        logger.warning(f"Could not cache ranks of {path} in {cache_path}: {e}")
+    return mergeable_ranks
+
+
+class Encoding:
+    """
+    Rank based byte-pair encoding matching the subset of `tiktoken.Encoding` used by
+    the llama Tokenizer.
+
+    The text is split into pieces by `pat_str`, and each piece not in the vocabulary
+    is merged with a heap: the pair whose concatenation has the lowest rank is merged
+    first, the leftmost pair on ties, which is the order tiktoken merges in.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pat_str: str,
+        mergeable_ranks: Dict[bytes, int],
+        special_tokens: Dict[str, int],
+        cache: Optional[BPECache] = None,
+    ):
+        """
+        :param name: The name of the encoding.
+        :param pat_str: The pre-tokenizer pattern, in `regex` module syntax.
+        :param mergeable_ranks: A mapping of token bytes to ranks, which are the token IDs.
+        :param special_tokens: A mapping of special tokens to token IDs.
+        :param cache: A cache for the token IDs of merged pieces.
+        """
+        self.name = name
+        self.pat_str = pat_str
+        self.pattern = regex.compile(pat_str)
+        self.mergeable_ranks = mergeable_ranks
+        self.special_tokens = special_tokens
+        self.special_tokens_set = set(special_tokens)
+        self.cache = cache if cache is not None else LRUCache()
+
+        self.n_vocab = max([*mergeable_ranks.values(), *special_tokens.values()]) + 1
+        # token ID -> token bytes
+        self._decoder: List[Optional[bytes]] = [None] * self.n_vocab
+        for token, rank in mergeable_ranks.items():
+            self._decoder[rank] = token
+        for token, rank in special_tokens.items():
+            self._decoder[rank] = token.encode("utf-8")
+
+    def _merge(self, piece: bytes) -> List[int]:
+        ranks = self.mergeable_ranks
+        # Parts are a doubly linked list of byte offsets into `piece`
+        starts = list(range(len(piece) + 1))
+        prev = [i - 1 for i in range(len(piece) + 1)]
+        nxt = [i + 1 for i in range(len(piece) + 1)]
+
+        def pair_rank(i: int) -> Optional[int]:
+            j = nxt[i]
+            if j >= len(piece):
+                return None
+            return ranks.get(piece[starts[i] : starts[nxt[j]]])
+
+        heap = []
+        for i in range(len(piece) - 1):
+            rank = pair_rank(i)
+            if rank is not None:
+                heap.append((rank, i))
+        heapq.heapify(heap)
+
+        while heap:
+            rank, i = heapq.heappop(heap)
+            # Skip pairs whose parts were merged since they were pushed
+            if starts[i] < 0 or nxt[i] >= len(piece) or pair_rank(i) != rank:
+                continue
+            j = nxt[i]
+            nxt[i] = nxt[j]
+            prev[nxt[j]] = i
+            starts[j] = -1
+            for k in (prev[i], i):
+                if k >= 0:
+                    rank = pair_rank(k)
+                    if rank is not None:
+                        heapq.heappush(heap, (rank, k))
+
+        tokens = []
+        i = 0
+        while i < len(piece):
+            tokens.append(ranks[piece[starts[i] : starts[nxt[i]]]])
+            i = nxt[i]
+        return tokens
+
+    def encode_ordinary(self, text: str) -> List[int]:
+        """
+        Encodes a string into token IDs, encoding special tokens as ordinary text.
+        """
+        try:
+            return self._encode_ordinary(text)
+        except UnicodeEncodeError:
+            # Like tiktoken, replace lone surrogates with U+FFFD and try again
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+            return self._encode_ordinary(text)
+
+    def _encode_ordinary(self, text: str) -> List[int]:
+        ranks = self.mergeable_ranks
+        tokens: List[int] = []
+        for match in self.pattern.finditer(text):
+            piece = match.group().encode("utf-8")
+            rank = ranks.get(piece)
+            if rank is not None:
+                tokens.append(rank)
+                continue
+            merged = self.cache.get(piece)
+            if merged is None:
+                merged = self.cache[piece] = tuple(self._merge(piece))
+            tokens.extend(merged)
+        return tokens
+
+    def encode(
+        self,
+        text: str,
+        *,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = "all",
+    ) -> List[int]:
+        """
+        Encodes a string into token IDs, like `tiktoken.Encoding.encode`.
+
+        :raises ValueError: If `text` contains a disallowed special token.
+        """
+        if allowed_special == "all":
+            allowed_special = self.special_tokens_set
+        if disallowed_special == "all":
+            disallowed_special = self.special_tokens_set - allowed_special
+        if disallowed_special:
+            match = self._special_pattern(disallowed_special).search(text)
+            if match:
+                raise ValueError(
+                    f"Encountered text corresponding to disallowed special token "
+                    f"{match.group()!r}."
+                )
+        if not allowed_special:
+            return self.encode_ordinary(text)
+
+        tokens: List[int] = []
+        parts = self._special_pattern(allowed_special).split(text)
+        for i, part in enumerate(parts):
+            if i % 2:
+                tokens.append(self.special_tokens[part])
+            else:
+                tokens.extend(self.encode_ordinary(part))
+        return tokens
+
+    @staticmethod
+    def _special_pattern(tokens: Collection[str]) -> regex.Pattern:
+        # Longest first, so a special token never loses to one of its prefixes
+        return regex.compile(
+            "("
+            + "|".join(map(regex.escape, sorted(tokens, key=len, reverse=True)))
+            + ")"
+        )
+
+    def encode_batch(
+        self,
+        text: List[str],
+        *,
+        num_threads: int = 8,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = "all",
+    ) -> List[List[int]]:
+        """
+        Encodes many strings, like `tiktoken.Encoding.encode_batch`.
+
+        `num_threads` is only accepted for compatibility: pure Python encoding holds the
+        GIL, so the strings are encoded one after another on the calling thread.
+        """
+        return [
+            self.encode(
+                s,
+                allowed_special=allowed_special,
+                disallowed_special=disallowed_special,
+            )
+            for s in text
+        ]
+
+    def encode_ordinary_batch(
+        self, text: List[str], *, num_threads: int = 8
+    ) -> List[List[int]]:
+        """
+        Encodes many strings ignoring special tokens, like
+        `tiktoken.Encoding.encode_ordinary_batch`; `num_threads` is ignored as above.
+        """
+        return [self.encode_ordinary(s) for s in text]
+
+    def decode_single_token_bytes(self, token: int) -> bytes:
+        """
+        Returns the bytes of a single token ID.
+
+        :raises KeyError: If `token` is not a token ID.
+        """
+        token_bytes = self._decoder[token] if 0 <= token < self.n_vocab else None
+        if token_bytes is None:
+            raise KeyError(token)
+        return token_bytes
+
+    def decode_bytes(self, tokens: List[int]) -> bytes:
+        return b"".join(map(self.decode_single_token_bytes, tokens))
+
+    def decode(self, tokens: List[int], errors: str = "replace") -> str:
+        return self.decode_bytes(tokens).decode("utf-8", errors=errors)
@@ -1,24 +1,39 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 # This software may be used and distributed in accordance with the terms of the Llama 3 Community License Agreement.
 
+import hashlib
 import os
+import re
+import sys
+from collections import OrderedDict
+from functools import lru_cache
 from logging import getLogger
 from pathlib import Path
 from typing import (
+    TYPE_CHECKING,
     AbstractSet,
     Collection,
     Dict,
+    FrozenSet,
     Iterator,
     List,
     Literal,
+    Optional,
     Sequence,
+    Tuple,
     TypedDict,
     Union,
     cast,
+    get_args,
 )
 
-import tiktoken
-from tiktoken.load import load_tiktoken_bpe
+import numpy as np
+
+from ..detokenizer import IncrementalDecoder
+from .bpe import Encoding, load_bpe, load_bpe_cached
+
+if TYPE_CHECKING:
+    import tiktoken
 
 logger = getLogger(__name__)
 
@@ -41,18 +56,40 @@ class Tokenizer:
 
     special_tokens: Dict[str, int]
     num_reserved_special_tokens = 256
+
+    # The tiktoken tokenizer can handle <=400k chars without
+    # pyo3_runtime.PanicException.
+    TIKTOKEN_MAX_ENCODE_CHARS = 400_000
+
+    # https://github.com/openai/tiktoken/issues/195
+    # Here we iterate over subsequences and split if we exceed the limit
+    # of max consecutive non-whitespace or whitespace characters.
+    MAX_NO_WHITESPACES_CHARS = 25_000
     pat_str = r"(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"  # noqa: E501
 
-    def __init__(self, model_path: str):
+    def __init__(
+        self,
+        model_path: str,
+        backend: Literal["tiktoken", "python"] = "tiktoken",
+        cache_ranks: bool = True,
+    ):
         """
         Initializes the Tokenizer with a Tiktoken model.
 
         Args:
             model_path (str): The path to the Tiktoken model file.
+            backend (str): "tiktoken" to encode with tiktoken, or "python" to encode with
+                the pure Python `bpe.Encoding`, which does not need tiktoken installed.
+            cache_ranks (bool): Whether to load the decoded ranks through a binary sidecar
+                file `<model_path>.ranks`, written on first use.
         """
         assert os.path.isfile(model_path), model_path
+        assert backend in ("tiktoken", "python"), backend
 
-        mergeable_ranks = load_tiktoken_bpe(model_path)
+        if cache_ranks:
+            mergeable_ranks = load_bpe_cached(model_path)
+        else:
+            mergeable_ranks = load_bpe(model_path)
         num_base_tokens = len(mergeable_ranks)
         special_tokens = [
             "<|begin_of_text|>",
@@ -72,13 +109,22 @@ class Tokenizer:
         self.special_tokens = {
             token: num_base_tokens + i for i, token in enumerate(special_tokens)
         }
-        self.model = tiktoken.Encoding(
+        if backend == "tiktoken":
+            # tiktoken is only needed by this backend
+            from tiktoken import Encoding as TiktokenEncoding
+
+            encoding = TiktokenEncoding
+        else:
+            encoding = Encoding
+        self.model: Union["tiktoken.Encoding", Encoding] = encoding(
             name=Path(model_path).name,
             pat_str=self.pat_str,
             mergeable_ranks=mergeable_ranks,
             special_tokens=self.special_tokens,
         )
-        logger.info(f"Reloaded tiktoken model from {model_path}")
+        logger.info(f"Reloaded {backend} model from {model_path}")
+
+        self.special_splitter = SpecialTokenSplitter(self.special_tokens)
 
         self.n_words: int = self.model.n_vocab
         # BOS / EOS token IDs
@@ -101,7 +147,8 @@ class Tokenizer:
         eos: bool,
         allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
         disallowed_special: Union[Literal["all"], Collection[str]] = (),
-    ) -> List[int]:
+        return_array: bool = False,
+    ) -> Union[List[int], np.ndarray]:
         """
         Encodes a string into a list of token IDs.
 
@@ -111,9 +158,10 @@ class Tokenizer:
             eos (bool): Whether to append the end-of-sequence token.
             allowed_tokens ("all"|set[str]): allowed special tokens in string
             disallowed_tokens ("all"|set[str]): special tokens that raise an error when in string
+            return_array (bool): Whether to return an `np.uint32` array instead of a list.
 
         Returns:
-            list[int]: A list of token IDs.
+            list[int]: A list of token IDs, or an `np.uint32` array if `return_array` is set.
 
         By default, setting disallowed_special=() encodes a string by ignoring
         special tokens. Specifically:
@@ -125,36 +173,244 @@ class Tokenizer:
         """
         assert type(s) is str
 
-        # The tiktoken tokenizer can handle <=400k chars without
-        # pyo3_runtime.PanicException.
-        TIKTOKEN_MAX_ENCODE_CHARS = 400_000
+        if return_array:
+            parts = [np.array([self.bos_id] if bos else [], dtype=np.uint32)]
+            for ids in self._encode_pieces(s, allowed_special, disallowed_special):
+                parts.append(np.array(ids, dtype=np.uint32))
+            parts.append(np.array([self.eos_id] if eos else [], dtype=np.uint32))
+            return np.concatenate(parts)
+
+        if (
+            not bos
+            and not allowed_special
+            and not disallowed_special
+            and len(s) <= self.MAX_NO_WHITESPACES_CHARS
+        ):
+            # Short plain strings are a single chunk; skip the chunking pipeline.
+            t = self.model.encode_ordinary(s)
+        else:
+            # Start from the BOS token instead of shifting the whole list to insert it
+            t = [self.bos_id] if bos else []
+            for ids in self._encode_pieces(s, allowed_special, disallowed_special):
+                t.extend(ids)
+        if eos:
+            t.append(self.eos_id)
+        return t
+
+    def encode_to(
+        self,
+        s: str,
+        buffer: np.ndarray,
+        offset: int = 0,
+        *,
+        bos: bool,
+        eos: bool,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = (),
+    ) -> int:
+        """
+        Encodes a string directly into a preallocated buffer of token IDs.
+
+        The IDs of each chunk are copied into `buffer` as soon as they are encoded, so
+        many documents can be packed into one training batch without intermediate lists.
 
-        # https://github.com/openai/tiktoken/issues/195
-        # Here we iterate over subsequences and split if we exceed the limit
-        # of max consecutive non-whitespace or whitespace characters.
-        MAX_NO_WHITESPACES_CHARS = 25_000
+        Args:
+            s (str): The input string to be encoded.
+            buffer (np.ndarray): A one dimensional integer array receiving the token IDs.
+            offset (int): The index in `buffer` of the first token ID.
+            bos (bool): Whether to prepend the beginning-of-sequence token.
+            eos (bool): Whether to append the end-of-sequence token.
+            allowed_special ("all"|set[str]): allowed special tokens in string
+            disallowed_special ("all"|set[str]): special tokens that raise an error when in string
 
-        substrs = (
-            substr
-            for i in range(0, len(s), TIKTOKEN_MAX_ENCODE_CHARS)
-            for substr in self._split_whitespaces_or_nonwhitespaces(
-                s[i : i + TIKTOKEN_MAX_ENCODE_CHARS], MAX_NO_WHITESPACES_CHARS
-            )
+        Returns:
+            int: The index in `buffer` after the last token ID written.
+
+        Raises:
+            ValueError: If `buffer` has no room for every token ID. The IDs which fit
+                may have been written already.
+        """
+        assert type(s) is str
+
+        def write(tokens: List[int]) -> None:
+            nonlocal offset
+            end = offset + len(tokens)
+            if end > len(buffer):
+                raise ValueError(
+                    f"Buffer of size {len(buffer)} cannot hold {end} token IDs"
+                )
+            buffer[offset:end] = tokens
+            offset = end
+
+        if bos:
+            write([self.bos_id])
+        for ids in self._encode_pieces(s, allowed_special, disallowed_special):
+            write(ids)
+        if eos:
+            write([self.eos_id])
+        return offset
+
+    def count_tokens(
+        self,
+        s: str,
+        *,
+        bos: bool = False,
+        eos: bool = False,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = (),
+    ) -> int:
+        """
+        Counts the token IDs `encode` would return, without building the full list.
+
+        Only the IDs of one chunk are alive at a time, so the peak memory does not grow
+        with the length of `s`.
+
+        Args:
+            s (str): The input string to be counted.
+            bos (bool): Whether to count the beginning-of-sequence token.
+            eos (bool): Whether to count the end-of-sequence token.
+            allowed_special ("all"|set[str]): allowed special tokens in string
+            disallowed_special ("all"|set[str]): special tokens that raise an error when in string
+
+        Returns:
+            int: The number of token IDs.
+        """
+        assert type(s) is str
+
+        n_tokens = int(bos) + int(eos)
+        for ids in self._encode_pieces(s, allowed_special, disallowed_special):
+            n_tokens += len(ids)
+        return n_tokens
+
+    def encode_truncated(
+        self,
+        s: str,
+        max_tokens: int,
+        *,
+        bos: bool,
+        eos: bool,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = (),
+    ) -> List[int]:
+        """
+        Encodes a string up to a token budget, stopping once the budget is reached.
+
+        The string is encoded in windows which end on a single space between two words,
+        where no token can cross, so the rest of a long document is never encoded.
+
+        Args:
+            s (str): The input string to be encoded.
+            max_tokens (int): The maximum number of token IDs to return.
+            bos (bool): Whether to prepend the beginning-of-sequence token.
+            eos (bool): Whether to append the end-of-sequence token.
+            allowed_special ("all"|set[str]): allowed special tokens in string
+            disallowed_special ("all"|set[str]): special tokens that raise an error when in string
+
+        Returns:
+            list[int]: The first `max_tokens` token IDs of `encode(s, bos=bos, eos=eos)`.
+        """
+        assert type(s) is str
+
+        t = [self.bos_id] if bos else []
+        for substr in self._substrs(s):
+            start = 0
+            while start < len(substr) and len(t) < max_tokens:
+                # A token spans about 4 characters, so a window this size usually
+                # fills the remaining budget at once.
+                end = self._word_boundary(
+                    substr, start, start + 4 * (max_tokens - len(t))
+                )
+                for ids in self._encode_pieces(
+                    substr[start:end], allowed_special, disallowed_special
+                ):
+                    t.extend(ids)
+                start = end
+            if len(t) >= max_tokens:
+                break
+        else:
+            if eos:
+                t.append(self.eos_id)
+        del t[max(max_tokens, 0) :]
+        return t
+
+    def encode_batch(
+        self,
+        texts: Sequence[str],
+        *,
+        bos: bool,
+        eos: bool,
+        allowed_special: Union[Literal["all"], AbstractSet[str]] = set(),
+        disallowed_special: Union[Literal["all"], Collection[str]] = (),
+        num_threads: int = 8,
+        return_array: bool = False,
+    ) -> Union[List[List[int]], Tuple[np.ndarray, np.ndarray]]:
+        """
+        Encodes many strings in parallel threads.
+
+        Every string is split and chunked exactly like `encode`, then all chunks are
+        encoded by tiktoken's threaded batch path, which releases the GIL.
+
+        Args:
+            texts (Sequence[str]): The input strings to be encoded.
+            bos (bool): Whether to prepend the beginning-of-sequence token to each string.
+            eos (bool): Whether to append the end-of-sequence token to each string.
+            allowed_special ("all"|set[str]): allowed special tokens in string
+            disallowed_special ("all"|set[str]): special tokens that raise an error when in string
+            num_threads (int): The number of encoding threads.
+            return_array (bool): Whether to return a flat id array with offsets.
+
+        Returns:
+            list[list[int]]: A list of token IDs per string, in input order. If `return_array`
+                is set, a flat `np.uint32` array of token IDs and an `np.int64` array of
+                `len(texts) + 1` offsets such that `ids[offsets[i]:offsets[i + 1]]` are the
+                token IDs of `texts[i]`.
+        """
+        split_allowed, allowed_special, disallowed_special = self._resolve_special(
+            allowed_special, disallowed_special
         )
-        t: List[int] = []
-        for substr in substrs:
-            t.extend(
-                self.model.encode(
-                    substr,
+        # The pieces of every string: ordinary text chunks and special token IDs
+        pieces: List[List[Union[str, int]]] = []
+        for s in texts:
+            assert type(s) is str
+            if disallowed_special:
+                pieces.append(list(self._substrs(s)))
+            else:
+                pieces.append(list(self._split_pieces(s, split_allowed)))
+
+        substrs = [piece for ps in pieces for piece in ps if isinstance(piece, str)]
+        if disallowed_special:
+            encoded = iter(
+                self.model.encode_batch(
+                    substrs,
+                    num_threads=num_threads,
                     allowed_special=allowed_special,
                     disallowed_special=disallowed_special,
                 )
             )
-        if bos:
-            t.insert(0, self.bos_id)
-        if eos:
-            t.append(self.eos_id)
-        return t
+        else:
+            encoded = iter(
+                self.model.encode_ordinary_batch(substrs, num_threads=num_threads)
+            )
+        batch: List[List[int]] = []
+        for ps in pieces:
+            t: List[int] = [self.bos_id] if bos else []
+            for piece in ps:
+                if isinstance(piece, str):
+                    t.extend(next(encoded))
+                else:
+                    t.append(piece)
+            if eos:
+                t.append(self.eos_id)
+            batch.append(t)
+
+        if not return_array:
+            return batch
+        offsets = np.zeros(len(batch) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in batch], out=offsets[1:])
+        ids = np.fromiter(
+            (token for t in batch for token in t), dtype=np.uint32, count=offsets[-1]
+        )
+        return ids, offsets
 
     def decode(self, t: Sequence[int]) -> str:
         """
@@ -169,6 +425,131 @@ class Tokenizer:
         # Typecast is safe here. Tiktoken doesn't do anything list-related with the sequence.
         return self.model.decode(cast(List[int], t))
 
+    def incremental_decoder(self, errors: str = "replace") -> IncrementalDecoder:
+        """
+        Creates a decoder which accepts token IDs one at a time during generation.
+
+        Args:
+            errors (str): How to handle invalid UTF-8 sequences.
+
+        Returns:
+            IncrementalDecoder: A decoder whose `push(token)` returns only the newly completed text.
+        """
+        return IncrementalDecoder(self.model.decode_single_token_bytes, errors=errors)
+
+    def _encode_pieces(
+        self,
+        s: str,
+        allowed_special: Union[Literal["all"], AbstractSet[str]],
+        disallowed_special: Union[Literal["all"], Collection[str]],
+    ) -> Iterator[List[int]]:
+        """
+        Encodes `s` piece by piece, yielding the token IDs of each piece in order.
+
+        Allowed special tokens are split off by `special_splitter` in a single pass, so
+        the text between them is encoded as ordinary text and tiktoken never scans for
+        special tokens. Only when some special tokens are disallowed is tiktoken left to
+        find and reject them.
+        """
+        split_allowed, allowed_special, disallowed_special = self._resolve_special(
+            allowed_special, disallowed_special
+        )
+        if disallowed_special:
+            for substr in self._substrs(s):
+                yield self.model.encode(
+                    substr,
+                    allowed_special=allowed_special,
+                    disallowed_special=disallowed_special,
+                )
+            return
+
+        for piece in self._split_pieces(s, split_allowed):
+            if isinstance(piece, str):
+                yield self.model.encode_ordinary(piece)
+            else:
+                yield [piece]
+
+    def _resolve_special(
+        self,
+        allowed_special: Union[Literal["all"], AbstractSet[str]],
+        disallowed_special: Union[Literal["all"], Collection[str]],
+    ) -> Tuple[Optional[AbstractSet[str]], AbstractSet[str], Collection[str]]:
+        """
+        Resolves "all" in the special token arguments.
+
+        Returns:
+            The allowed tokens for `_split_pieces` (None for all of them), and the
+            allowed and disallowed special token sets.
+        """
+        # None lets the splitter accept every special token without a set lookup
+        split_allowed = None if allowed_special == "all" else allowed_special
+        if allowed_special == "all":
+            allowed_special = self.model.special_tokens_set
+        if disallowed_special == "all":
+            disallowed_special = self.model.special_tokens_set - allowed_special
+        return split_allowed, allowed_special, disallowed_special
+
+    def _split_pieces(
+        self, s: str, split_allowed: Optional[AbstractSet[str]]
+    ) -> Iterator[Union[str, int]]:
+        """
+        Splits `s` into ordinary text chunks (str) and allowed special token IDs (int).
+
+        Allowed special tokens are split off first, then the text between them is
+        chunked by `_substrs`, so no chunk ever contains a special token.
+        """
+        parts = (
+            self.special_splitter.split(s, split_allowed)
+            if split_allowed is None or split_allowed
+            else [s]
+        )
+        for i, part in enumerate(parts):
+            if i % 2:
+                yield self.special_tokens[part]
+            elif len(part) <= self.MAX_NO_WHITESPACES_CHARS:
+                if part:
+                    yield part
+            else:
+                yield from self._substrs(part)
+
+    def _substrs(self, s: str) -> Iterator[str]:
+        """
+        Splits `s` into chunks which tiktoken can encode without panicking.
+        """
+        return (
+            substr
+            for i in range(0, len(s), self.TIKTOKEN_MAX_ENCODE_CHARS)
+            for substr in self._split_whitespaces_or_nonwhitespaces(
+                s[i : i + self.TIKTOKEN_MAX_ENCODE_CHARS],
+                self.MAX_NO_WHITESPACES_CHARS,
+            )
+        )
+
+    @staticmethod
+    def _word_boundary(s: str, start: int, end: int) -> int:
+        """
+        Finds the index in `s` closest to `end` (and after `start`) to split at so both
+        halves encode to the same token IDs as the whole, or `len(s)` if there is none.
+
+        Pre-tokens only ever start with whitespace, so the text can be split in front of
+        a single space between two non-whitespace characters.
+        """
+
+        def is_boundary(i: int) -> bool:
+            return i + 1 < len(s) and not s[i - 1].isspace() and not s[i + 1].isspace()
+
+        if end >= len(s):
+            return len(s)
+        i = s.rfind(" ", start + 1, end + 1)
+        while i != -1 and not is_boundary(i):
+            i = s.rfind(" ", start + 1, i)
+        if i != -1:
+            return i
+        i = s.find(" ", end + 1)
+        while i != -1 and not is_boundary(i):
+            i = s.find(" ", i + 1)
+        return len(s) if i == -1 else i
+
     @staticmethod
     def _split_whitespaces_or_nonwhitespaces(
         s: str, max_consecutive_slice_len: int
@@ -176,38 +557,149 @@ class Tokenizer:
         """
         Splits the string `s` so that each substring contains no more than `max_consecutive_slice_len`
         consecutive whitespaces or consecutive non-whitespaces.
+
+        Run boundaries are found with NumPy over the codepoint buffer instead of testing
+        every character in Python, and a string no longer than the limit cannot contain
+        a longer run, so it is yielded as is.
         """
-        current_slice_len = 0
-        current_slice_is_space = s[0].isspace() if len(s) > 0 else False
-        slice_start = 0
+        if len(s) <= max_consecutive_slice_len:
+            yield s
+            return
 
-        for i in range(len(s)):
-            is_now_space = s[i].isspace()
+        codepoints = np.frombuffer(
+            s.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32
+        )
+        is_space = _whitespace_table()[codepoints]
+        run_starts = np.flatnonzero(
+            np.concatenate(([True], is_space[1:] != is_space[:-1]))
+        )
+        run_lengths = np.diff(np.append(run_starts, len(s)))
 
-            if current_slice_is_space ^ is_now_space:
-                current_slice_len = 1
-                current_slice_is_space = is_now_space
-            else:
-                current_slice_len += 1
-                if current_slice_len > max_consecutive_slice_len:
-                    yield s[slice_start:i]
-                    slice_start = i
-                    current_slice_len = 1
+        slice_start = 0
+        for run in np.flatnonzero(run_lengths > max_consecutive_slice_len):
+            run_start = int(run_starts[run])
+            run_end = run_start + int(run_lengths[run])
+            # Cut every `max_consecutive_slice_len` characters from the run start
+            for cut in range(
+                run_start + max_consecutive_slice_len,
+                run_end,
+                max_consecutive_slice_len,
+            ):
+                yield s[slice_start:cut]
+                slice_start = cut
         yield s[slice_start:]
 
 
+@lru_cache(maxsize=None)
+def _whitespace_table() -> np.ndarray:
+    # str.isspace() for every codepoint
+    table = np.zeros(sys.maxunicode + 1, dtype=np.bool_)
+    table[[c for c in range(sys.maxunicode + 1) if chr(c).isspace()]] = True
+    return table
+
+
+class SpecialTokenSplitter:
+    """
+    Splits text on special tokens in a single pass over the text.
+
+    The special tokens are stored in a character trie which is compiled into one
+    pattern, e.g. `<\\|(?:begin_of_text\\|>|e(?:nd_...|ot_id\\|>)|...)`. At every position
+    the regex engine follows a single path of the trie instead of trying each special
+    token in turn, and text without special tokens costs one scan of the text.
+    """
+
+    # The number of compiled patterns kept for subsets of the special tokens
+    max_patterns = 64
+
+    def __init__(self, special_tokens: Dict[str, int]):
+        self.special_tokens = special_tokens
+        self.pattern = self.compile(special_tokens)
+        self._patterns: Dict[FrozenSet[str], re.Pattern] = {}
+
+    @staticmethod
+    def compile(tokens: Collection[str]) -> re.Pattern:
+        """
+        Compiles a pattern matching the longest of `tokens` from a trie of `tokens`.
+
+        The pattern has a single group, so `re.split` keeps the matched tokens.
+        """
+        # Nested dicts keyed by character; the "" key marks the end of a token
+        trie: dict = {}
+        for token in tokens:
+            node = trie
+            for char in token:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node: dict) -> str:
+            branches = [
+                re.escape(char) + build(child)
+                for char, child in sorted(node.items())
+                if char
+            ]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            # Greedy, so the longest token ending here or below wins
+            return f"(?:{body})?" if "" in node else body
+
+        # An empty set of tokens never matches
+        return re.compile(f"({build(trie)})" if trie else "(?!)")
+
+    def split(self, s: str, allowed: Optional[AbstractSet[str]] = None) -> List[str]:
+        """
+        Splits `s` on special tokens.
+
+        Args:
+            s (str): The text to be split.
+            allowed (set[str] | None): The special tokens to split on, or None for all.
+
+        Returns:
+            list[str]: The text between special tokens at even indices and the special
+                tokens at odd indices, like `re.split` with a group.
+        """
+        if allowed is None:
+            return self.pattern.split(s)
+
+        key = frozenset(allowed)
+        pattern = self._patterns.get(key)
+        if pattern is None:
+            if len(self._patterns) >= self.max_patterns:
+                self._patterns.clear()
+            pattern = self._patterns[key] = self.compile(
+                key & self.special_tokens.keys()
+            )
+        return pattern.split(s)
+
+
 class ChatFormat:
-    def __init__(self, tokenizer: Tokenizer):
+    def __init__(self, tokenizer: Tokenizer, cache_size: int = 1024):
         self.tokenizer = tokenizer
+        # (role, content digest) -> encoded message, least recently used first
+        self.cache_size = cache_size
+        self._message_cache: OrderedDict[Tuple[str, bytes], List[int]] = OrderedDict()
+        # Header token templates, built once per role
+        self._separator = self.tokenizer.encode("\n\n", bos=False, eos=False)
+        self._headers: Dict[str, List[int]] = {
+            role: self._build_header(role) for role in get_args(Role)
+        }
 
-    def encode_header(self, message: Message) -> List[int]:
+    def _build_header(self, role: str) -> List[int]:
         tokens = []
         tokens.append(self.tokenizer.special_tokens["<|start_header_id|>"])
-        tokens.extend(self.tokenizer.encode(message["role"], bos=False, eos=False))
+        tokens.extend(self.tokenizer.encode(role, bos=False, eos=False))
         tokens.append(self.tokenizer.special_tokens["<|end_header_id|>"])
-        tokens.extend(self.tokenizer.encode("\n\n", bos=False, eos=False))
+        tokens.extend(self._separator)
         return tokens
 
+    def encode_header(self, message: Message) -> List[int]:
+        header = self._headers.get(message["role"])
+        if header is None:  # not a Role, e.g. a custom tool role
+            header = self._headers[message["role"]] = self._build_header(
+                message["role"]
+            )
+        return list(header)
+
     def encode_message(self, message: Message) -> List[int]:
         tokens = self.encode_header(message)
         tokens.extend(
@@ -216,11 +708,135 @@ class ChatFormat:
         tokens.append(self.tokenizer.special_tokens["<|eot_id|>"])
         return tokens
 
+    @staticmethod
+    def message_key(message: Message) -> Tuple[str, bytes]:
+        """
+        Identifies a message by its role and a digest of its content.
+        """
+        digest = hashlib.blake2b(message["content"].encode("utf-8"), digest_size=16)
+        return message["role"], digest.digest()
+
+    def encode_message_cached(self, message: Message) -> List[int]:
+        """
+        Encodes a message, reusing the token IDs of a previously seen identical message.
+
+        Args:
+            message (Message): The message to be encoded.
+
+        Returns:
+            list[int]: The token IDs of the message. The list is shared with the cache and must not be modified.
+        """
+        key = self.message_key(message)
+        tokens = self._message_cache.get(key)
+        if tokens is not None:
+            self._message_cache.move_to_end(key)
+            return tokens
+
+        tokens = self.encode_message(message)
+        self._message_cache[key] = tokens
+        if len(self._message_cache) > self.cache_size:
+            self._message_cache.popitem(last=False)
+        return tokens
+
+    def count_dialog_tokens(self, dialog: Dialog) -> int:
+        """
+        Counts the token IDs `encode_dialog_prompt` would return, without building them.
+
+        Cached messages are counted from the cache; the rest are counted with
+        `Tokenizer.count_tokens` and are not added to the cache.
+
+        Args:
+            dialog (Dialog): The dialog to be counted.
+
+        Returns:
+            int: The number of token IDs of the prompt.
+        """
+        n_tokens = 1  # <|begin_of_text|>
+        for message in dialog:
+            tokens = self._message_cache.get(self.message_key(message))
+            if tokens is not None:
+                n_tokens += len(tokens)
+                continue
+            n_tokens += len(self.encode_header(message)) + 1  # <|eot_id|>
+            n_tokens += self.tokenizer.count_tokens(message["content"].strip())
+        n_tokens += len(self._headers["assistant"])
+        return n_tokens
+
     def encode_dialog_prompt(self, dialog: Dialog) -> List[int]:
         tokens = []
         tokens.append(self.tokenizer.special_tokens["<|begin_of_text|>"])
         for message in dialog:
-            tokens.extend(self.encode_message(message))
+            tokens.extend(self.encode_message_cached(message))
         # Add the start of an assistant message for the model to complete.
         tokens.extend(self.encode_header({"role": "assistant", "content": ""}))
         return tokens
+
+
+class DialogEncoder:
+    """
+    Incrementally encodes a growing dialog for multi-turn serving.
+
+    The token IDs of the dialog seen so far are kept, so each call only encodes the
+    messages after the longest unchanged prefix. The start offset of every message is
+    tracked to allow reusing the KV-cache of the unchanged prefix downstream.
+    """
+
+    def __init__(self, formatter: ChatFormat):
+        self.formatter = formatter
+        self.tokens: List[int] = [
+            formatter.tokenizer.special_tokens["<|begin_of_text|>"]
+        ]
+        # offsets[i] is the index in `tokens` where message i starts
+        self.offsets: List[int] = []
+        self._keys: List[Tuple[str, bytes]] = []
+
+    def append(self, message: Message) -> List[int]:
+        """
+        Appends a message to the dialog.
+
+        Args:
+            message (Message): The next message of the dialog.
+
+        Returns:
+            list[int]: The token IDs of the message.
+        """
+        tokens = self.formatter.encode_message_cached(message)
+        self.offsets.append(len(self.tokens))
+        self._keys.append(self.formatter.message_key(message))
+        self.tokens.extend(tokens)
+        return tokens
+
+    def truncate(self, n_messages: int) -> None:
+        """
+        Drops every message after the first `n_messages`.
+        """
+        if n_messages < len(self.offsets):
+            del self.tokens[self.offsets[n_messages] :]
+            del self.offsets[n_messages:]
+            del self._keys[n_messages:]
+
+    def encode_dialog_prompt(self, dialog: Dialog) -> Tuple[List[int], int]:
+        """
+        Encodes a dialog prompt, reusing the encoded prefix shared with the previous dialog.
+
+        Args:
+            dialog (Dialog): The full dialog, usually the previous one plus a new turn.
+
+        Returns:
+            tuple[list[int], int]: The token IDs of the prompt, identical to
+                `ChatFormat.encode_dialog_prompt`, and the number of leading token IDs
+                unchanged since the previous call.
+        """
+        n_common = 0
+        for key, message in zip(self._keys, dialog):
+            if key != self.formatter.message_key(message):
+                break
+            n_common += 1
+        self.truncate(n_common)
+        n_unchanged = len(self.tokens)
+
+        for message in dialog[n_common:]:
+            self.append(message)
+        # Add the start of an assistant message for the model to complete.
+        header = self.formatter.encode_header({"role": "assistant", "content": ""})
+        return self.tokens + header, n_unchanged
@@ -0,0 +1,98 @@
+"""
+Module: tok.shard
+
+Headered binary shards of token ids which training code can `np.memmap` without parsing.
+
+Layout (little-endian):
+
+    header    magic "TOKS", uint32 version, uint32 itemsize (2 or 4),
+              uint32 vocab size, uint64 n_tokens, uint64 n_docs, 32 reserved bytes
+    offsets   uint64[n_docs + 1]     document boundaries into the ids
+    ids       uint16[n_tokens] or uint32[n_tokens]
+"""
+
+import os
+from typing import Union
+
+import numpy as np
+
+SHARD_MAGIC = b"TOKS"
+SHARD_VERSION = 1
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        ("itemsize", "<u4"),
+        ("vocab_size", "<u4"),
+        ("n_tokens", "<u8"),
+        ("n_docs", "<u8"),
+        ("reserved", "V32"),
+    ]
+)
+
+
+def get_id_dtype(vocab_size: int) -> np.dtype:
+    return np.dtype("<u2") if vocab_size <= 1 << 16 else np.dtype("<u4")
+
+
+def write_shard(
+    path: Union[str, os.PathLike],
+    ids: np.ndarray,
+    offsets: np.ndarray,
+    vocab_size: int,
+) -> None:
+    """
+    Write token ids and their document boundaries to a shard.
+
+    :param path: The output file path.
+    :param ids: The flat token ids of every document.
+    :param offsets: Document boundaries such that `ids[offsets[i]:offsets[i + 1]]`
+        are the ids of document `i`.
+    :param vocab_size: The vocab size, which selects uint16 or uint32 ids.
+    """
+    dtype = get_id_dtype(vocab_size)
+    if len(ids) and int(ids.max()) >= 1 << (8 * dtype.itemsize):
+        raise ValueError(f"Token id {int(ids.max())} does not fit in {dtype}")
+    if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(ids):
+        raise ValueError("Document offsets must span the ids from 0 to len(ids)")
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = SHARD_MAGIC
+    header["version"] = SHARD_VERSION
+    header["itemsize"] = dtype.itemsize
+    header["vocab_size"] = vocab_size
+    header["n_tokens"] = len(ids)
+    header["n_docs"] = len(offsets) - 1
+
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(np.asarray(offsets, dtype="<u8").tobytes())
+        f.write(np.asarray(ids, dtype=dtype).tobytes())
+
+
+def load_shard(path: Union[str, os.PathLike]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Memory-map a shard written by `write_shard`.
+
+    :param path: The shard file path.
+
+    :return: A read-only memmap of the ids and of the document offsets.
+    """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != SHARD_MAGIC:
+        raise ValueError("Token shard magic invalid")
+    header = header[0]
+    if header["version"] != SHARD_VERSION:
+        raise ValueError(f"Token shard version {header['version']} is not supported")
+
+    n_docs = int(header["n_docs"])
+    offset = HEADER_DTYPE.itemsize
+    offsets = np.memmap(path, dtype="<u8", mode="r", offset=offset, shape=(n_docs + 1,))
+    offset += offsets.nbytes
+    n_tokens = int(header["n_tokens"])
+    if n_tokens == 0:  # np.memmap refuses empty mappings
+        return np.empty(0, get_id_dtype(int(header["vocab_size"]))), offsets
+    dtype = np.dtype("<u2") if header["itemsize"] == 2 else np.dtype("<u4")
+    ids = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n_tokens,))
+    return ids, offsets
@@ -0,0 +1,161 @@
+import re
+
+import numpy as np
+import pytest
+
+from tok.gguf.cli.scan import scan_file
+from tok.gguf.constants import GGUFValueType
+from tok.gguf.reader import GGUFReader, ReaderArrayParts
+from tok.gguf.writer import GGUFWriter
+
+N_BLOCKS = 3
+TOKENS = ["<s>", "</s>", "", "a", "bc", "😸"] + [f"t{i}" for i in range(2000)]
+
+
+@pytest.fixture(scope="module")
+def gguf_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("gguf") / "model.gguf"
+    writer = GGUFWriter(path, "llama")
+    writer.add_uint32("general.file_type", 7)
+    writer.add_string("general.name", "test")
+    writer.add_array("tokenizer.ggml.tokens", TOKENS)
+    writer.add_array("tokenizer.ggml.scores", [-float(i) for i in range(len(TOKENS))])
+    writer.add_array("tokenizer.ggml.token_type", [1] * len(TOKENS))
+    writer.add_tensor(
+        "token_embd.weight", np.arange(32, dtype=np.float32).reshape(4, 8)
+    )
+    for bid in range(N_BLOCKS):
+        for name in ("attn_q", "ffn_up"):
+            writer.add_tensor(
+                f"blk.{bid}.{name}.weight", np.full((8, 8), bid, dtype=np.float16)
+            )
+    writer.write_header_to_file()
+    writer.write_kv_data_to_file()
+    writer.write_tensors_to_file()
+    writer.close()
+    return path
+
+
+def assert_fields_equal(a, b):
+    assert (a.offset, a.name, a.types) == (b.offset, b.name, b.types)
+    assert list(a.data) == list(b.data)
+    assert [bytes(part) for part in a.parts] == [bytes(part) for part in b.parts]
+
+
+def test_lazy_reader(gguf_path):
+    eager = GGUFReader(gguf_path)
+    lazy = GGUFReader(gguf_path, lazy=True)
+
+    assert list(lazy.fields) == list(eager.fields)
+    # only the header fields and general.alignment lookup are built on open
+    assert len(lazy.fields._fields) == 3
+    assert_fields_equal(lazy.fields["general.name"], eager.fields["general.name"])
+    assert lazy.get_field("missing") is None
+    for key in eager.fields:
+        assert_fields_equal(lazy.fields[key], eager.fields[key])
+
+    assert len(lazy.tensors) == len(eager.tensors) == 1 + 2 * N_BLOCKS
+    assert lazy.get_tensor(-1).name == eager.tensors[-1].name
+    for a, b in zip(lazy.tensors, eager.tensors):
+        assert (a.name, a.tensor_type, a.n_bytes) == (b.name, b.tensor_type, b.n_bytes)
+        assert a.data_offset == b.data_offset
+        assert np.array_equal(a.data, b.data)
+    with pytest.raises(IndexError):
+        lazy.get_tensor(len(eager.tensors))
+
+
+def test_bulk_arrays(gguf_path):
+    reader = GGUFReader(gguf_path)
+    tokens = reader.fields["tokenizer.ggml.tokens"]
+    assert isinstance(tokens.parts, ReaderArrayParts)
+    # per element parts, like any other field
+    assert [bytes(tokens.parts[idx]).decode("utf-8") for idx in tokens.data] == TOKENS
+    assert tokens.parts[tokens.data[4] - 1].tolist() == [2]  # length of "bc"
+
+    buffer, offsets = tokens.parts.buffer, tokens.parts.offsets
+    assert [
+        buffer[start:end].tobytes().decode("utf-8")
+        for start, end in zip(offsets, offsets[1:])
+    ] == TOKENS
+
+    scores = reader.fields["tokenizer.ggml.scores"]
+    assert scores.parts.values.dtype == np.float32
+    assert scores.parts.values.tolist() == [-float(i) for i in range(len(TOKENS))]
+    assert [scores.parts[idx][0] for idx in scores.data[:3]] == [0.0, -1.0, -2.0]
+
+
+def test_field_values(gguf_path):
+    reader = GGUFReader(gguf_path)
+    fields = reader.fields
+    assert fields["general.file_type"].get_value() == 7
+    assert fields["general.name"].get_value() == "test"
+    assert fields["general.architecture"].get_value() == "llama"
+    assert fields["GGUF.version"].get_value() == 3
+    assert fields["tokenizer.ggml.tokens"].get_value() == TOKENS
+    assert fields["tokenizer.ggml.scores"].get_value()[:3] == [0.0, -1.0, -2.0]
+
+    scores = fields["tokenizer.ggml.scores"].get_array()
+    assert scores.dtype == np.float32 and len(scores) == len(TOKENS)
+    assert fields["tokenizer.ggml.token_type"].get_array().tolist() == [1] * len(TOKENS)
+    tokens = fields["tokenizer.ggml.tokens"].get_array()
+    assert tokens.dtype == object and tokens.tolist() == TOKENS
+    with pytest.raises(ValueError):
+        fields["general.name"].get_array()
+
+    lazy = GGUFReader(gguf_path, lazy=True)
+    for key, field in fields.items():
+        assert lazy.fields[key].get_value() == field.get_value()
+
+
+def test_compact_fields(gguf_path):
+    reader = GGUFReader(gguf_path)
+    tokens = reader.fields["tokenizer.ggml.tokens"]
+    # parts are only built on access
+    assert tokens._parts is None
+    assert tokens.types == [GGUFValueType.ARRAY, GGUFValueType.STRING]
+    assert tokens.get_value() == TOKENS and tokens._parts is None
+    assert tokens.get_array_length() == len(TOKENS) and tokens._parts is None
+    assert len(tokens.data) == len(TOKENS)
+    assert not hasattr(tokens, "__dict__")
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_tensor_lookup(gguf_path, lazy):
+    reader = GGUFReader(gguf_path, lazy=lazy)
+    tensor = reader.get_tensor_by_name("blk.1.ffn_up.weight")
+    assert tensor.name == "blk.1.ffn_up.weight"
+    assert np.all(tensor.data == 1)
+    assert reader.get_tensor_by_name("missing") is None
+    with pytest.raises(ValueError, match="has no value type"):
+        tensor.field.get_value()
+    if lazy:  # only the tensor that was looked up is read
+        assert list(reader.tensors._tensors) == [4]
+
+    names = [t.name for t in reader.filter_tensors("blk.*.attn_q.weight")]
+    assert names == [f"blk.{bid}.attn_q.weight" for bid in range(N_BLOCKS)]
+    names = [t.name for t in reader.filter_tensors(re.compile(r"^blk\.[01]\.ffn"))]
+    assert names == ["blk.0.ffn_up.weight", "blk.1.ffn_up.weight"]
+    assert reader.filter_tensors("attn_q") == []
+
+    assert [t.name for t in reader.get_block_tensors(2)] == [
+        "blk.2.attn_q.weight",
+        "blk.2.ffn_up.weight",
+    ]
+    assert reader.get_block_tensors(N_BLOCKS) == []
+    blocks = reader.get_blocks()
+    assert list(blocks) == list(range(N_BLOCKS))
+    assert all(len(tensors) == 2 for tensors in blocks.values())
+
+
+def test_scan_file(gguf_path, tmp_path):
+    row = scan_file(str(gguf_path), ["general.name", "missing"])
+    assert row["architecture"] == "llama" and row["error"] is None
+    assert row["file_type"] == "Q8_0"  # general.file_type 7
+    assert row["tensor_count"] == 1 + 2 * N_BLOCKS
+    assert row["tensor_bytes"] == 32 * 4 + N_BLOCKS * 2 * 64 * 2
+    assert row["vocab_size"] == len(TOKENS)
+    assert (row["general.name"], row["missing"]) == ("test", None)
+
+    bad = tmp_path / "bad.gguf"
+    bad.write_bytes(b"junk")
+    assert scan_file(str(bad))["error"].startswith("ValueError")
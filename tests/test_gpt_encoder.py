@@ -0,0 +1,326 @@
+import io
+import json
+import os
+import random
+from array import array
+from collections import Counter
+
+import pytest
+
+from tok.cache import LRUCache
+from tok.gpt.encoder import Encoder
+from tok.gpt.vocab import compile_vocab, load_vocab
+
+CORPUS = (
+    "The quick brown fox jumps over the lazy dog. "
+    "https://example.com/path/to/the/resource?query=the+lazy+dog&page=10 "
+    "aGVsbG8gd29ybGQgdGhlIHF1aWNrIGJyb3duIGZveA== "
+    "def get_pairs(word): return set(zip(word, word[1:])) "
+    "Ünïcödé tèxt wörks tóó, 😸 and numbers 1234567890 too!\n\n"
+)
+
+
+def train_merges(text: str, n_merges: int) -> list[tuple[str, str]]:
+    # Minimal byte-level BPE trainer used to build a small, valid merge table.
+    byte_encoder = Encoder.bytes_to_unicode()
+    words = Counter(
+        tuple(byte_encoder[b] for b in token.encode("utf-8"))
+        for token in text.split(" ")
+        if token
+    )
+    merges = []
+    for _ in range(n_merges):
+        pairs = Counter()
+        for word, count in words.items():
+            for pair in zip(word, word[1:]):
+                pairs[pair] += count
+        if not pairs:
+            break
+        best = max(pairs, key=lambda pair: (pairs[pair], pair))
+        merges.append(best)
+        merged = Counter()
+        for word, count in words.items():
+            new_word, i = [], 0
+            while i < len(word):
+                if i < len(word) - 1 and (word[i], word[i + 1]) == best:
+                    new_word.append(word[i] + word[i + 1])
+                    i += 2
+                else:
+                    new_word.append(word[i])
+                    i += 1
+            merged[tuple(new_word)] += count
+        words = merged
+    return merges
+
+
+def merge_uncached(encoder: Encoder, engine, token: str) -> str:
+    # bpe and bpe_heap share the encoder cache
+    encoder.cache.clear()
+    return engine(token)
+
+
+def build_encoder(merges: list[tuple[str, str]], **kwargs) -> Encoder:
+    vocab = list(Encoder.bytes_to_unicode().values())
+    vocab += [first + second for first, second in merges]
+    encoder = {token: idx for idx, token in enumerate(dict.fromkeys(vocab))}
+    return Encoder(encoder, merges, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def merges() -> list[tuple[str, str]]:
+    return train_merges(CORPUS * 4, 200)
+
+
+@pytest.fixture
+def encoder(merges) -> Encoder:
+    return build_encoder(merges)
+
+
+def test_roundtrip(encoder):
+    assert encoder.decode(encoder.encode(CORPUS)) == CORPUS
+
+
+def test_heap_engine_matches_scan(merges):
+    scan = build_encoder(merges, merge_engine="scan")
+    heap = build_encoder(merges, merge_engine="heap")
+    assert heap.encode(CORPUS) == scan.encode(CORPUS)
+
+
+@pytest.mark.parametrize(
+    "token",
+    ["aaaaaaaaaaa", "thethethe" * 50, "=" * 257, "ab" * 300],
+)
+def test_heap_engine_pathological_tokens(encoder, token):
+    token = "".join(encoder.byte_encoder[b] for b in token.encode("utf-8"))
+    expected = merge_uncached(encoder, encoder.bpe, token)
+    assert merge_uncached(encoder, encoder.bpe_heap, token) == expected
+
+
+def test_heap_engine_random_tokens(encoder):
+    rng = random.Random(0)
+    alphabet = sorted(set(CORPUS))
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 64)))
+        for token in encoder.pattern.findall(text):
+            token = "".join(encoder.byte_encoder[b] for b in token.encode("utf-8"))
+            expected = merge_uncached(encoder, encoder.bpe, token)
+            assert merge_uncached(encoder, encoder.bpe_heap, token) == expected
+
+
+def test_bpe_ids(encoder):
+    for token in encoder.pattern.findall(CORPUS):
+        expected = [
+            encoder.encoder[symbol]
+            for symbol in encoder.bpe(encoder.byte_encode(token)).split(" ")
+        ]
+        assert list(encoder.bpe_ids(token.encode("utf-8"))) == expected
+
+
+@pytest.mark.parametrize("merge_engine", ["scan", "heap"])
+def test_merged_symbol_missing_from_vocab(encoder, merges, merge_engine):
+    # find a pre-token that merges into a single symbol
+    symbol = next(
+        first + second
+        for first, second in reversed(merges)
+        if encoder.encode(encoder.decode([encoder.encoder[first + second]]))
+        == [encoder.encoder[first + second]]
+    )
+    text = encoder.decode([encoder.encoder[symbol]])
+    vocab = {token: idx for token, idx in encoder.encoder.items() if token != symbol}
+    with pytest.raises(KeyError):
+        Encoder(vocab, merges, merge_engine).encode(text)
+
+
+def test_unknown_merge_engine(merges):
+    with pytest.raises(ValueError):
+        build_encoder(merges, merge_engine="unknown")
+
+
+def test_cache_is_bounded(merges):
+    encoder = build_encoder(merges, cache=LRUCache(max_entries=8))
+    encoder.encode(CORPUS)
+    assert len(encoder.cache) <= 8
+    assert encoder.cache_stats.evictions > 0
+
+
+def test_cache_stats(encoder):
+    encoder.encode("the lazy dog")
+    misses = encoder.cache_stats.misses
+    encoder.encode("the lazy dog")
+    assert encoder.cache_stats.misses == misses
+    assert encoder.cache_stats.hits >= 3
+    assert 0.0 < encoder.cache_stats.hit_rate < 1.0
+
+
+def test_lru_cache_byte_budget():
+    cache = LRUCache(max_entries=None, max_bytes=1024)
+    for i in range(100):
+        cache[f"token-{i}"] = f"t o k e n - {i}"
+    assert cache.nbytes <= 1024
+    assert "token-99" in cache
+    assert "token-0" not in cache
+    assert cache.get("token-0") is None
+    assert cache.stats.misses == 1
+
+
+def test_lru_cache_recency():
+    cache = LRUCache(max_entries=2)
+    cache["a"] = "a"
+    cache["b"] = "b"
+    cache.get("a")
+    cache["c"] = "c"
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+
+def test_byte_encode(encoder):
+    text = "Ünïcödé 😸\n"
+    expected = "".join(encoder.byte_encoder[b] for b in text.encode("utf-8"))
+    assert encoder.byte_encode(text) == expected
+
+
+def test_token_bytes(encoder):
+    for token, idx in encoder.encoder.items():
+        assert encoder.token_bytes(idx) == bytes(encoder.byte_decoder[c] for c in token)
+    with pytest.raises(KeyError):
+        encoder.token_bytes(len(encoder.encoder))
+
+
+def test_decode_partial_utf8(encoder):
+    tokens = encoder.encode("🙃")
+    assert encoder.decode(tokens[:1]) == "�"
+    with pytest.raises(UnicodeDecodeError):
+        encoder.decode(tokens[:1], errors="strict")
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_encode_batch(encoder, num_workers):
+    texts = CORPUS.split(" ") + ["", CORPUS]
+    expected = [encoder.encode(text) for text in texts]
+    assert (
+        encoder.encode_batch(texts, num_workers=num_workers, batch_size=3) == expected
+    )
+
+    ids, offsets = encoder.encode_batch(
+        texts, num_workers=num_workers, batch_size=3, return_array=True
+    )
+    assert len(offsets) == len(texts) + 1
+    for i, tokens in enumerate(expected):
+        assert ids[offsets[i] : offsets[i + 1]].tolist() == tokens
+
+    decoded = encoder.decode_batch(ids, offsets, num_workers=num_workers, batch_size=3)
+    assert decoded == texts
+    assert encoder.decode_batch(expected, num_workers=num_workers) == texts
+
+
+def test_encode_batch_empty(encoder):
+    assert encoder.encode_batch([]) == []
+    ids, offsets = encoder.encode_batch([], return_array=True)
+    assert len(ids) == 0 and offsets.tolist() == [0]
+
+
+def test_compiled_vocab(merges, tmp_path):
+    encoder = build_encoder(merges)
+    path = tmp_path / "vocab.bin"
+    compile_vocab(path, encoder.encoder, merges)
+
+    vocab = load_vocab(path)
+    assert vocab.n_vocab == len(encoder.encoder)
+    assert vocab.n_merges == len(merges)
+    assert vocab.encoder() == encoder.encoder
+    assert vocab.bpe_merges() == merges
+
+    compiled = Encoder.from_compiled(str(path))
+    assert compiled.encode(CORPUS) == encoder.encode(CORPUS)
+
+
+def test_compiled_vocab_tables(merges, tmp_path):
+    encoder = build_encoder(merges, merge_engine="heap")
+    encoder.encoder["<|endoftext|>"] = len(encoder.encoder) + 1  # leave a hole
+    path = tmp_path / "vocab.bin"
+    compile_vocab(path, encoder.encoder, merges)
+    encoder = Encoder(encoder.encoder, merges, merge_engine="heap")
+
+    compiled = Encoder.from_compiled(str(path), merge_engine="heap")
+    assert compiled._merges == encoder._merges
+    assert compiled._byte_ids == encoder._byte_ids
+    assert compiled._token_bytes == encoder._token_bytes
+    assert compiled.encode(CORPUS) == encoder.encode(CORPUS)
+    assert compiled.decode(encoder.encode(CORPUS)) == CORPUS
+    # the heap engine never decodes the vocab strings
+    assert "encoder" not in vars(compiled) and "bpe_ranks" not in vars(compiled)
+
+    assert compiled.encoder == encoder.encoder
+    assert compiled.bpe_ranks == encoder.bpe_ranks
+    assert compiled.decoder == encoder.decoder
+    for token in ["Ġquick", "Ġthe", "Ġlazy"]:
+        expected = merge_uncached(encoder, encoder.bpe, token)
+        assert merge_uncached(compiled, compiled.bpe_heap, token) == expected
+
+
+def test_get_encoder_stale_compiled(merges, tmp_path):
+    encoder = build_encoder(merges)
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    (model_dir / "encoder.json").write_text(json.dumps(encoder.encoder))
+    bpe = "#version: 0.2\n" + "".join(f"{a} {b}\n" for a, b in merges)
+    (model_dir / "vocab.bpe").write_text(bpe, encoding="utf-8")
+    compile_vocab(model_dir / "vocab.bin", encoder.encoder, merges)
+    loaded = Encoder.get_encoder("model", str(tmp_path), merge_engine="heap")
+    assert hasattr(loaded, "_vocab")
+
+    # a source changed after compiling; the compiled vocab must not be used
+    bpe = "#version: 0.2\n" + "".join(f"{a} {b}\n" for a, b in merges[:10])
+    (model_dir / "vocab.bpe").write_text(bpe, encoding="utf-8")
+    mtime = os.stat(model_dir / "vocab.bin").st_mtime_ns + 1_000_000_000
+    os.utime(model_dir / "vocab.bpe", ns=(mtime, mtime))
+    loaded = Encoder.get_encoder("model", str(tmp_path), merge_engine="heap")
+    assert not hasattr(loaded, "_vocab")
+    assert len(loaded.bpe_ranks) == 10
+
+
+def test_compiled_vocab_invalid(tmp_path):
+    path = tmp_path / "vocab.bin"
+    path.write_bytes(b"GGUF" + bytes(64))
+    with pytest.raises(ValueError):
+        load_vocab(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+@pytest.mark.parametrize("merge_engine", ["scan", "heap"])
+def test_encode_stream(merges, chunk_size, merge_engine):
+    encoder = build_encoder(merges, merge_engine=merge_engine)
+    text = CORPUS + "We'll see   it's   done'llama \t\n  😸😸 " + CORPUS
+    expected = encoder.encode(text)
+
+    stream = encoder.encode_stream(io.StringIO(text), chunk_size=chunk_size)
+    assert [idx for ids in stream for idx in ids] == expected
+
+    stream = encoder.encode_stream(
+        io.BytesIO(text.encode("utf-8")), chunk_size=chunk_size, as_array=True
+    )
+    batches = list(stream)
+    assert all(isinstance(ids, array) for ids in batches)
+    assert [idx for ids in batches for idx in ids] == expected
+
+
+def test_encode_stream_truncated_utf8(encoder):
+    data = "😸".encode("utf-8")[:3]
+    with pytest.raises(UnicodeDecodeError):
+        list(encoder.encode_stream(io.BytesIO(data)))
+
+
+def test_incremental_decoder(encoder):
+    text = CORPUS + "🙃 done"
+    decoder = encoder.incremental_decoder()
+    pieces = [decoder.push(token) for token in encoder.encode(text)]
+    assert "".join(pieces) + decoder.flush() == text
+    # the 4 byte emoji only appears once its last byte arrives
+    assert "" in pieces and "🙃" in pieces
+
+
+def test_incremental_decoder_flush_incomplete(encoder):
+    decoder = encoder.incremental_decoder()
+    tokens = encoder.encode("🙃")
+    assert decoder.push(tokens[0]) == ""
+    assert decoder.flush() == "�"
+    assert decoder.push(encoder.encode("a")[0]) == "a"
@@ -0,0 +1,54 @@
+import random
+import sys
+
+import numpy as np
+import pytest
+import regex
+
+from tok.gpt.pretokenize import GPT2_PATTERN, PreTokenizer, get_codepoint_classes
+
+SAMPLES = [
+    "",
+    " ",
+    "Hello world",
+    "I'm sure they'll say it's 'fine' -- won't they?",
+    "   leading and trailing   ",
+    "tabs\tand\nnewlines\r\n\n  \n x",
+    "numbers 1234567890 and ٣٤٥ and Ⅻ",
+    "Ünïcödé tèxt wörks tóó, 日本語のテキスト, עברית, Ελληνικά",
+    "emoji 😸😸 and symbols ©®™ and nbsp em　space",
+    "mixed'S'T'RE'vE 'm'LL'd",
+]
+
+
+@pytest.fixture(scope="module")
+def pretokenizer() -> PreTokenizer:
+    return PreTokenizer.default()
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_matches_reference_pattern(pretokenizer, text):
+    assert pretokenizer.findall(text) == regex.findall(GPT2_PATTERN, text)
+
+
+def test_matches_reference_pattern_random(pretokenizer):
+    rng = random.Random(0)
+    # bias towards characters that exercise every alternative
+    alphabet = list(" \t\n\r  'sltrvdm.!?-_/09٣Ⅻaé日😸́\x1c\x85")
+    for _ in range(2000):
+        text = "".join(
+            rng.choice(alphabet) if rng.random() < 0.8 else chr(rng.randrange(0x30000))
+            for _ in range(rng.randint(0, 32))
+        )
+        assert pretokenizer.findall(text) == regex.findall(GPT2_PATTERN, text)
+
+
+def test_codepoint_classes_from_processor():
+    unicode = pytest.importorskip("tok.gguf.unicode")
+    processor = unicode.CodepointProcessor()
+    assert np.array_equal(get_codepoint_classes(processor), get_codepoint_classes())
+
+
+def test_invalid_table():
+    with pytest.raises(ValueError):
+        PreTokenizer(np.zeros(sys.maxunicode, dtype=np.uint8))
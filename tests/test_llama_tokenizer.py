@@ -1,16 +1,44 @@
 # Copyright (c) Meta Platforms, Inc. and affiliates.
 # This software may be used and distributed in accordance with the terms of the Llama 3 Community License Agreement.
 
+import os
+import random
+import shutil
+import tempfile
 from unittest import TestCase
 
-from tok.llama.tokenizer import ChatFormat, Tokenizer
+import numpy as np
+
+from tok.llama.bpe import HEADER_DTYPE, load_bpe, load_bpe_cached, load_ranks
+from tok.llama.tokenizer import ChatFormat, DialogEncoder, Tokenizer
 
 # TOKENIZER_PATH=<path> python -m unittest llama/test_tokenizer.py
 
 
+def split_whitespaces_or_nonwhitespaces(s, max_consecutive_slice_len):
+    # Reference per-character implementation
+    current_slice_len = 0
+    current_slice_is_space = s[0].isspace() if len(s) > 0 else False
+    slice_start = 0
+
+    for i in range(len(s)):
+        is_now_space = s[i].isspace()
+
+        if current_slice_is_space ^ is_now_space:
+            current_slice_len = 1
+            current_slice_is_space = is_now_space
+        else:
+            current_slice_len += 1
+            if current_slice_len > max_consecutive_slice_len:
+                yield s[slice_start:i]
+                slice_start = i
+                current_slice_len = 1
+    yield s[slice_start:]
+
+
 class TokenizerTests(TestCase):
     def setUp(self):
-        self.tokenizer = Tokenizer("tokenizers/bpe/tokenizer.model")
+        self.tokenizer = Tokenizer("tokenizers/bpe/tokenizer.model", cache_ranks=False)
         self.format = ChatFormat(self.tokenizer)
 
     def test_special_tokens(self):
@@ -33,6 +61,182 @@ class TokenizerTests(TestCase):
             "<|begin_of_text|>This is a test sentence.<|end_of_text|>",
         )
 
+    def test_split_whitespaces_or_nonwhitespaces(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            s = "".join(
+                rng.choice("ab \t\n\u3000\x1c") for _ in range(rng.randint(0, 40))
+            )
+            n = rng.randint(1, 8)
+            self.assertEqual(
+                list(self.tokenizer._split_whitespaces_or_nonwhitespaces(s, n)),
+                list(split_whitespaces_or_nonwhitespaces(s, n)),
+            )
+
+    def test_encode_long_runs(self):
+        s = "a" * 60_000 + " " * 30_000 + "b"
+        self.assertEqual(
+            self.tokenizer.decode(self.tokenizer.encode(s, bos=False, eos=False)), s
+        )
+
+    def test_encode_batch(self):
+        texts = [
+            "This is a test sentence.",
+            "",
+            "<|eot_id|> is a special token",
+            "a" * 30_000 + " tail",
+        ]
+        expected = [self.tokenizer.encode(s, bos=True, eos=False) for s in texts]
+        self.assertEqual(
+            self.tokenizer.encode_batch(texts, bos=True, eos=False, num_threads=2),
+            expected,
+        )
+
+        ids, offsets = self.tokenizer.encode_batch(
+            texts, bos=True, eos=False, return_array=True
+        )
+        self.assertEqual(len(offsets), len(texts) + 1)
+        for i, t in enumerate(expected):
+            self.assertEqual(ids[offsets[i] : offsets[i + 1]].tolist(), t)
+
+    def test_encode_batch_special(self):
+        texts = ["<|eot_id|>", "plain <|start_header_id|>"]
+        self.assertEqual(
+            self.tokenizer.encode_batch(
+                texts, bos=False, eos=True, allowed_special="all"
+            ),
+            [
+                self.tokenizer.encode(s, bos=False, eos=True, allowed_special="all")
+                for s in texts
+            ],
+        )
+
+    def test_encode_batch_special_long_runs(self):
+        eot_id = self.tokenizer.special_tokens["<|eot_id|>"]
+        texts = [
+            "x" * 30_000 + "<|eot_id|>" + "y" * 30_000,
+            "<|eot_id|>" + " " * 26_000 + "z<|eot_id|>",
+        ]
+        for allowed_special in ("all", {"<|eot_id|>"}):
+            expected = [
+                self.tokenizer.encode(
+                    s, bos=False, eos=False, allowed_special=allowed_special
+                )
+                for s in texts
+            ]
+            self.assertEqual(
+                self.tokenizer.encode_batch(
+                    texts, bos=False, eos=False, allowed_special=allowed_special
+                ),
+                expected,
+            )
+        # the special token splits the runs, which are chunked on their own
+        head, tail = texts[0].split("<|eot_id|>")
+        self.assertEqual(
+            expected[0],
+            self.tokenizer.encode(head, bos=False, eos=False)
+            + [eot_id]
+            + self.tokenizer.encode(tail, bos=False, eos=False),
+        )
+        self.assertEqual(self.tokenizer.decode(expected[1]), texts[1])
+
+    def test_encode_special(self):
+        rng = random.Random(0)
+        pieces = ["<|eot_id|>", "<|eot_id", "<|", "<", "|>", "<|begin_of_text|>", "a b"]
+        for allowed_special in ("all", {"<|eot_id|>"}, set()):
+            for _ in range(200):
+                text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+                self.assertEqual(
+                    self.tokenizer.encode(
+                        text, bos=False, eos=False, allowed_special=allowed_special
+                    ),
+                    self.tokenizer.model.encode(
+                        text, allowed_special=allowed_special, disallowed_special=()
+                    ),
+                )
+
+        with self.assertRaises(ValueError):
+            self.tokenizer.encode(
+                "<|eot_id|>", bos=False, eos=False, disallowed_special="all"
+            )
+
+    def test_encode_array(self):
+        text = "This is a test sentence."
+        ids = self.tokenizer.encode(text, bos=True, eos=True, return_array=True)
+        self.assertEqual(ids.dtype, np.uint32)
+        self.assertEqual(ids.tolist(), self.tokenizer.encode(text, bos=True, eos=True))
+
+    def test_encode_to(self):
+        texts = ["This is a test sentence.", "", "a" * 30_000 + " tail"]
+        expected = [self.tokenizer.encode(s, bos=True, eos=True) for s in texts]
+        buffer = np.zeros(sum(map(len, expected)), dtype=np.uint32)
+        offset = 0
+        for s, t in zip(texts, expected):
+            end = self.tokenizer.encode_to(s, buffer, offset, bos=True, eos=True)
+            self.assertEqual(buffer[offset:end].tolist(), t)
+            offset = end
+        self.assertEqual(offset, len(buffer))
+
+        with self.assertRaises(ValueError):
+            self.tokenizer.encode_to(texts[0], buffer[:3], bos=True, eos=True)
+
+    def test_count_tokens(self):
+        for text in ["", "This is a test sentence.", "a" * 30_000 + " tail"]:
+            self.assertEqual(
+                self.tokenizer.count_tokens(text, bos=True, eos=True),
+                len(self.tokenizer.encode(text, bos=True, eos=True)),
+            )
+
+    def test_encode_truncated(self):
+        rng = random.Random(0)
+        words = [
+            "It's",
+            "don't",
+            "12345",
+            "(a)",
+            "\u65e5\u672c",
+            "x,",
+            "--",
+            "\n",
+            "  ",
+        ]
+        for _ in range(50):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(0, 200)))
+            expected = self.tokenizer.encode(text, bos=True, eos=True)
+            for max_tokens in (0, 1, 2, 7, 50, len(expected) - 1, len(expected) + 5):
+                self.assertEqual(
+                    self.tokenizer.encode_truncated(
+                        text, max_tokens, bos=True, eos=True
+                    ),
+                    expected[: max(max_tokens, 0)],
+                )
+
+    def test_incremental_decoder(self):
+        text = "Streaming 😸 emoji, ünïcödé and 日本語 text."
+        tokens = self.tokenizer.encode(text, bos=False, eos=False)
+        decoder = self.tokenizer.incremental_decoder()
+        pieces = [decoder.push(token) for token in tokens]
+        self.assertEqual("".join(pieces) + decoder.flush(), text)
+        self.assertEqual(len(pieces), len(tokens))
+
+    def test_encode_header(self):
+        for role in ("system", "user", "assistant", "ipython"):
+            header = self.format.encode_header({"role": role, "content": ""})
+            self.assertEqual(
+                header,
+                [
+                    128006,  # <|start_header_id|>
+                    *self.tokenizer.encode(role, bos=False, eos=False),
+                    128007,  # <|end_header_id|>
+                    271,  # "\n\n"
+                ],
+            )
+            # callers may extend the returned header
+            header.append(0)
+            self.assertNotEqual(
+                self.format.encode_header({"role": role, "content": ""}), header
+            )
+
     def test_encode_message(self):
         message = {
             "role": "user",
@@ -97,3 +301,120 @@ class TokenizerTests(TestCase):
                 271,  # "\n\n"
             ],
         )
+
+    def test_encode_dialog_cached(self):
+        dialog = [
+            {"role": "system", "content": "This is a test sentence."},
+            {"role": "user", "content": "This is a response."},
+        ]
+        expected = self.format.encode_dialog_prompt(dialog)
+        self.assertEqual(self.format.encode_dialog_prompt(dialog), expected)
+        self.assertEqual(len(self.format._message_cache), 2)
+
+    def test_count_dialog_tokens(self):
+        dialog = [
+            {"role": "system", "content": "This is a test sentence."},
+            {"role": "user", "content": "  This is a response.\n"},
+        ]
+        n_tokens = len(self.format.encode_dialog_prompt(dialog[:1]))
+        self.assertEqual(self.format.count_dialog_tokens(dialog[:1]), n_tokens)
+        self.assertEqual(
+            self.format.count_dialog_tokens(dialog),
+            len(self.format.encode_dialog_prompt(dialog)),
+        )
+
+    def test_dialog_encoder(self):
+        encoder = DialogEncoder(self.format)
+        dialog = [{"role": "system", "content": "This is a test sentence."}]
+        for turn in range(4):
+            tokens, n_unchanged = encoder.encode_dialog_prompt(dialog)
+            self.assertEqual(tokens, self.format.encode_dialog_prompt(dialog))
+            # everything before the newest message is reused
+            self.assertEqual(n_unchanged, encoder.offsets[-1])
+            for i, message in enumerate(dialog):
+                start = encoder.offsets[i]
+                end = start + len(self.format.encode_message(message))
+                self.assertEqual(tokens[start:end], self.format.encode_message(message))
+            role = "user" if turn % 2 == 0 else "assistant"
+            dialog = dialog + [{"role": role, "content": f"Turn {turn}."}]
+
+        # an edited message invalidates everything after it
+        edited = [dialog[0], {"role": "user", "content": "Edited."}] + dialog[2:]
+        tokens, n_unchanged = encoder.encode_dialog_prompt(edited)
+        self.assertEqual(tokens, self.format.encode_dialog_prompt(edited))
+        self.assertEqual(n_unchanged, encoder.offsets[1])
+
+
+class PythonBackendTests(TokenizerTests):
+    # Every TokenizerTests case again, encoded without tiktoken
+    def setUp(self):
+        self.tokenizer = Tokenizer(
+            "tokenizers/bpe/tokenizer.model", backend="python", cache_ranks=False
+        )
+        self.format = ChatFormat(self.tokenizer)
+
+    def test_matches_tiktoken(self):
+        reference = Tokenizer("tokenizers/bpe/tokenizer.model", cache_ranks=False)
+        rng = random.Random(0)
+        pieces = ["Hello", " world", "'s", " 1234567", "\n\n", "  ", "日本語", "😸"]
+        pieces += ["ünïcödé", "<|eot_id|>", "https://example.com/a?b=c", "\t-", "X"]
+        pieces += ["\udce4", "\ud83d"]  # lone surrogates
+        for _ in range(200):
+            text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+            for allowed_special in ("all", set()):
+                self.assertEqual(
+                    self.tokenizer.encode(
+                        text, bos=True, eos=True, allowed_special=allowed_special
+                    ),
+                    reference.encode(
+                        text, bos=True, eos=True, allowed_special=allowed_special
+                    ),
+                )
+        self.assertEqual(
+            self.tokenizer.model.encode_ordinary("a\udce4b"),
+            reference.model.encode_ordinary("a\udce4b"),
+        )
+
+
+class RanksCacheTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.tmpdir, "tokenizer.model")
+        shutil.copy("tokenizers/bpe/tokenizer.model", self.model_path)
+        self.cache_path = self.model_path + ".ranks"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_bpe_cached(self):
+        expected = load_bpe(self.model_path)
+        self.assertIsNone(load_ranks(self.cache_path, self.model_path))
+        self.assertEqual(load_bpe_cached(self.model_path), expected)
+        self.assertEqual(load_ranks(self.cache_path, self.model_path), expected)
+
+        # a touched but unchanged rank file still matches by digest
+        os.utime(self.model_path, ns=(0, 0))
+        self.assertEqual(load_ranks(self.cache_path, self.model_path), expected)
+        # and the sidecar now records the new stat
+        with open(self.cache_path, "rb") as f:
+            header = np.frombuffer(f.read(HEADER_DTYPE.itemsize), HEADER_DTYPE)[0]
+        self.assertEqual(header["source_mtime_ns"], 0)
+        self.assertEqual(header["source_size"], os.path.getsize(self.model_path))
+
+        with open(self.model_path, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        with open(self.model_path, "wb") as f:
+            f.writelines(lines[:-1])
+        self.assertIsNone(load_ranks(self.cache_path, self.model_path))
+        self.assertEqual(load_bpe_cached(self.model_path), load_bpe(self.model_path))
+        self.assertEqual(len(load_ranks(self.cache_path, self.model_path)), 127999)
+
+    def test_tokenizer(self):
+        tokenizer = Tokenizer(self.model_path)
+        self.assertTrue(os.path.exists(self.cache_path))
+        self.assertEqual(
+            Tokenizer(self.model_path).encode(
+                "This is a test sentence.", bos=True, eos=True
+            ),
+            tokenizer.encode("This is a test sentence.", bos=True, eos=True),
+        )
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from tok.cli.raw_to_ids import ShardWriter
+from tok.shard import load_shard, write_shard
+
+
+@pytest.mark.parametrize("vocab_size, dtype", [(50257, np.uint16), (128256, np.uint32)])
+def test_shard_roundtrip(tmp_path, vocab_size, dtype):
+    path = tmp_path / "shard.bin"
+    ids = np.array([1, 2, 3, vocab_size - 1, 5], dtype=np.uint32)
+    offsets = np.array([0, 3, 3, 5], dtype=np.uint64)
+    write_shard(path, ids, offsets, vocab_size)
+
+    loaded_ids, loaded_offsets = load_shard(path)
+    assert loaded_ids.dtype == dtype
+    assert loaded_ids.tolist() == ids.tolist()
+    assert loaded_offsets.tolist() == offsets.tolist()
+
+
+def test_empty_shard(tmp_path):
+    path = tmp_path / "shard.bin"
+    write_shard(path, np.empty(0, np.uint32), np.zeros(1, np.uint64), 50257)
+    ids, offsets = load_shard(path)
+    assert len(ids) == 0 and offsets.tolist() == [0]
+
+
+def test_invalid_shard(tmp_path):
+    path = tmp_path / "shard.bin"
+    with pytest.raises(ValueError):
+        write_shard(path, np.array([70000]), np.array([0, 1]), 50257)
+    path.write_bytes(b"GGUF" + bytes(128))
+    with pytest.raises(ValueError):
+        load_shard(path)
+
+
+@pytest.mark.parametrize("eos_id", [-1, 99])
+def test_shard_writer(tmp_path, eos_id):
+    writer = ShardWriter(tmp_path / "docs", 100, shard_tokens=10, eos_id=eos_id)
+    doc_lengths = [4, 4, 4, 4, 4, 4, 4, 4, 4, 4, 25, 3, 3]
+    docs = [np.arange(n, dtype=np.uint32) for n in doc_lengths]
+    # documents arrive in uneven batches
+    for start, end in [(0, 10), (10, 11), (11, 13)]:
+        writer.add(
+            np.concatenate(docs[start:end]),
+            np.array(doc_lengths[start:end], dtype=np.int64),
+        )
+    writer.flush()
+
+    loaded = []
+    for path in writer.paths:
+        ids, offsets = load_shard(path)
+        shard = [ids[a:b].tolist() for a, b in zip(offsets[:-1], offsets[1:])]
+        # only a single document longer than the limit may exceed it
+        assert len(ids) <= 10 or len(shard) == 1
+        loaded.extend(shard)
+    tail = [] if eos_id < 0 else [eos_id]
+    assert loaded == [doc.tolist() + tail for doc in docs]
+    sizes = [len(load_shard(path)[0]) for path in writer.paths]
+    assert sizes == ([8] * 5 + [25, 6] if eos_id < 0 else [10] * 5 + [26, 8])